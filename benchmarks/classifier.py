@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from re import IGNORECASE, MULTILINE, match
+from timeit import repeat
+
+from mysqlite.parser import STATEMENTS, classify
+
+
+MIX = (  # (weight, query), roughly what a GUI client plus an application send
+  (60, "SELECT id, name, email FROM users WHERE id = 42"),
+  (10, "SELECT COUNT(*) FROM posts WHERE user_id IN (SELECT id FROM users WHERE name LIKE 'a%')"),
+  (5, "INSERT INTO posts (user_id, title) VALUES (1, 'hello')"),
+  (5, "SET NAMES utf8mb4"),
+  (3, "SHOW VARIABLES LIKE 'lower_case_%'"),
+  (3, "SHOW FULL COLUMNS FROM `users`"),
+  (3, "SHOW TABLE STATUS LIKE 'users'"),
+  (2, "SHOW INDEX FROM users"),
+  (2, "SHOW CREATE TABLE users"),
+  (2, "SHOW DATABASES"),
+  (2, "SHOW FULL PROCESSLIST"),
+  (1, "SHOW STATUS"),
+  (1, "USE main"),
+  (1, "HELP 'contents'"),
+)
+
+
+def guess_legacy(query):
+  for function, pattern in STATEMENTS.items():
+    results = match(pattern, query, IGNORECASE | MULTILINE)
+    if results:
+      return function, results.groupdict()
+  return None, None
+
+
+def classify_legacy(query):
+  keyword = query.split(" ", 1)[0].upper()
+  return keyword, guess_legacy(query) if keyword != "SELECT" else (None, None)
+
+
+def main():
+  parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+  parser.add_argument("--queries", default=20000, type=int, help="Queries per run")
+  parser.add_argument("--repeat", default=5, type=int, help="Number of runs")
+  args = parser.parse_args()
+
+  workload = [query for weight, query in MIX for _ in range(weight)]
+  workload = (workload * (args.queries // len(workload) + 1))[:args.queries]
+
+  for _, query in MIX:  # sanity check, both paths must agree
+    expected = guess_legacy(query)
+    statement = classify(query)
+    assert expected == (statement.function, statement.params), query
+
+  legacy = min(repeat(lambda: [classify_legacy(query) for query in workload], number=1, repeat=args.repeat))
+  single = min(repeat(lambda: [classify(query) for query in workload], number=1, repeat=args.repeat))
+
+  print(f"queries={args.queries} statements={len(MIX)}")
+  print(f"guess_statement: {legacy * 1e6 / args.queries:8.2f} us/query")
+  print(f"classify:        {single * 1e6 / args.queries:8.2f} us/query")
+  print(f"speedup:         {legacy / single:8.2f}x")
+
+  for _, query in MIX:
+    legacy = min(repeat(lambda: classify_legacy(query), number=2000, repeat=3))
+    single = min(repeat(lambda: classify(query), number=2000, repeat=3))
+    print(f"  {query[:40]:40} {legacy * 1e6 / 2000:6.2f} -> {single * 1e6 / 2000:6.2f} us")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,145 @@
+from socket import IPPROTO_TCP, TCP_NODELAY, create_connection
+from struct import pack, unpack
+from time import perf_counter
+
+from mysqlite.definitions import Capability, Command
+
+
+CAPABILITIES = Capability.LONG_PASSWORD | Capability.LONG_FLAG | \
+  Capability.CONNECT_WITH_DB | Capability.PROTOCOL_41 | Capability.SECURE_CONNECTION
+
+
+class ClientError(Exception):
+  def __init__(self, code, message):
+    super().__init__(f"({code}) {message}")
+    self.code = code
+
+
+class Client:  # minimal text-protocol client, enough to drive the server
+  def __init__(self, host, port, username="root", database="main", deprecate_eof=True):
+    self.sock = create_connection((host, port))
+    self.sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+    self.rfile = self.sock.makefile("rb")
+    self.number = 0
+
+    handshake = self.read_packet()  # only the capabilities are needed
+    rest = handshake[handshake.index(b"\0", 1) + 1:]  # after the server version
+    server = unpack("<H", rest[13:15])[0] | unpack("<H", rest[18:20])[0] << 16
+    self.number = 1
+    capabilities = CAPABILITIES
+
+    if deprecate_eof:
+      capabilities |= Capability.DEPRECATE_EOF
+
+    self.deprecate_eof = bool(capabilities & server & Capability.DEPRECATE_EOF)
+
+    payload = pack("<IIB23x", capabilities, 1 << 30, 33)
+    payload += username.encode() + b"\0" + b"\0" + database.encode() + b"\0"
+    self.write_packet(payload)
+    self.check(self.read_packet())
+
+  def close(self):
+    try:
+      self.number = 0
+      self.write_packet(bytes((Command.QUIT, )))
+    finally:
+      self.rfile.close()
+      self.sock.close()
+
+  def write_packet(self, payload):
+    self.sock.sendall(pack("<I", len(payload))[:3] + bytes((self.number & 0xff, )) + payload)
+
+  def read_packet(self):
+    chunks = []
+
+    while True:  # 16M payloads continue in the next packet
+      header = self.rfile.read(4)
+
+      if len(header) < 4:
+        raise ConnectionError("Connection closed by server")
+
+      length = header[0] | header[1] << 8 | header[2] << 16
+      chunks.append(self.rfile.read(length))
+
+      if length < 0xffffff:
+        return b"".join(chunks)
+
+  def check(self, packet):
+    if packet[0] == 0xff:
+      raise ClientError(unpack("<H", packet[1:3])[0], packet[9:].decode(errors="replace"))
+    return packet
+
+  def query(self, sql):  # columns, rows and seconds until the first row (or the reply)
+    self.number = 0
+    started = perf_counter()
+    self.write_packet(bytes((Command.QUERY, )) + sql.encode())
+
+    packet = self.check(self.read_packet())
+
+    if packet[0] == 0:  # OK, no result set
+      return [], [], perf_counter() - started
+
+    count = read_length(packet, 0)[0]
+    columns = []
+
+    for _ in range(count):
+      columns.append(read_column(self.read_packet()))
+
+    if not self.deprecate_eof:
+      self.read_packet()  # EOF
+
+    first = None
+    rows = []
+
+    while True:
+      packet = self.check(self.read_packet())
+
+      if first is None:
+        first = perf_counter() - started
+
+      if packet[0] == 0xfe and len(packet) < 9:  # EOF, or OK with CLIENT_DEPRECATE_EOF
+        return columns, rows, first
+
+      rows.append(read_row(packet, count))
+
+
+def read_length(packet, offset):
+  first = packet[offset]
+
+  if first < 0xfb:
+    return first, offset + 1
+  if first == 0xfb:
+    return None, offset + 1
+  if first == 0xfc:
+    return unpack("<H", packet[offset + 1:offset + 3])[0], offset + 3
+  if first == 0xfd:
+    return unpack("<I", packet[offset + 1:offset + 4] + b"\0")[0], offset + 4
+  return unpack("<Q", packet[offset + 1:offset + 9])[0], offset + 9
+
+
+def read_column(packet):
+  offset = 0
+  values = []
+
+  for _ in range(6):  # catalog, schema, table, org_table, name, org_name
+    length, offset = read_length(packet, offset)
+    values.append(packet[offset:offset + length])
+    offset += length
+
+  return values[4].decode()
+
+
+def read_row(packet, count):
+  offset = 0
+  row = []
+
+  for _ in range(count):
+    length, offset = read_length(packet, offset)
+
+    if length is None:
+      row.append(None)
+    else:
+      row.append(packet[offset:offset + length])
+      offset += length
+
+  return row
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from io import BytesIO
+from json import dump, load
+from os.path import dirname, join
+from statistics import median
+from sys import exit
+from timeit import timeit
+
+from benchmarks.row_encoder import META, make_rows
+from mysqlite.counters import NAMES
+from mysqlite.definitions import FieldType
+from mysqlite.reader import PacketReader
+from mysqlite.server import Session
+from mysqlite.utils import Payload, binary_converters, column_converters, \
+  pack_binary_row, pack_header, pack_resstring, pack_row, pack_string, \
+  pack_varinteger, read_data, read_header, read_string
+
+
+BASELINES = join(dirname(__file__), "baselines.json")
+
+
+class Sink:  # socket stand-in, keeps only the byte count
+  def __init__(self):
+    self.written = 0
+
+  def write(self, data):
+    self.written += len(data)
+
+
+class Source:  # socket stand-in, serves the same packets over and over
+  def __init__(self, data):
+    self.data = data
+    self.position = 0
+
+  def recv_into(self, view):
+    size = min(len(view), len(self.data) - self.position)
+    view[:size] = self.data[self.position:self.position + size]
+    self.position = (self.position + size) % len(self.data)
+    return size
+
+
+class FakeServer:
+  flush_bytes = 65536
+  flush_rows = 0
+  cache = None
+  compression = None
+  slow_log = None
+  metrics = None
+
+
+class FakeSession(Session):
+  def __init__(self):
+    self.server = FakeServer()
+    self.wfile = Sink()
+    self.packet = BytesIO()
+    self.packet_limit = 1 << 30
+    self.counters = dict.fromkeys(NAMES, 0)
+    self.traced = False
+
+
+def calibrate():  # plain interpreter work, lets baselines travel between machines
+  total = 0
+  for value in range(1000):
+    total += value * 2
+  return total
+
+
+def cases(rows):
+  session = FakeSession()
+  converters = column_converters(META)
+  binary = binary_converters(META)
+  row = rows[7]
+  frame = pack_header(200, 3) + bytes(200)
+  text = "SELECT id, name FROM users WHERE id = 42\0".encode()
+  execute = bytes(range(10))  # COM_STMT_EXECUTE: statement id, flags, iterations
+  reader = PacketReader(Source(frame * 100))
+  large = PacketReader(Source(pack_header(100000, 3) + bytes(100000)))  # over the reader's buffer
+
+  def send_resultset():
+    session.send_resultset((META, rows))
+
+  def send_binary_resultset():
+    session.binary = True
+    session.send_resultset((META, rows))
+    session.binary = False
+
+  return {  # name: (callable, calls per timing)
+    "pack_varinteger_small": (lambda: pack_varinteger(200), 1),
+    "pack_varinteger_large": (lambda: pack_varinteger(70000), 1),
+    "pack_string": (lambda: pack_string("user42@example.com"), 1),
+    "pack_resstring": (lambda: pack_resstring("user42@example.com"), 1),
+    "pack_resstring_null": (lambda: pack_resstring(None), 1),
+    "pack_header": (lambda: pack_header(200, 3), 1),
+    "read_header": (lambda: read_header(BytesIO(frame)), 1),
+    "read_string": (lambda: read_string(BytesIO(text)), 1),
+    "payload_read_string": (lambda: read_string(Payload(text)), 1),
+    "payload_read_data": (lambda: read_data(Payload(execute), "<IBI"), 1),
+    "packet_reader": (lambda: reader.packet(1 << 30), 1),
+    "packet_reader_large": (lambda: large.packet(1 << 30), 1),
+    "pack_row": (lambda: pack_row(row, converters), 1),
+    "pack_binary_row": (lambda: pack_binary_row(row, binary), 1),
+    "send_columndef": (lambda: session.send_columndef("email", FieldType.VAR_STRING, 255, 0), 1),
+    "send_resultset": (send_resultset, len(rows)),
+    "send_binary_resultset": (send_binary_resultset, len(rows)),
+  }
+
+
+def timing(function, calls, number):  # ns per call (per row for result sets)
+  count = max(number // calls, 1)
+  return timeit(function, number=count) / (count * calls) * 1e9
+
+
+def measure(function, calls, number, runs):  # medians of ns and calibration units
+  values = []
+  relatives = []
+
+  for _ in range(runs):
+    value = timing(function, calls, number)
+    unit = timing(calibrate, 1, number // 100)  # right after, to follow clock changes
+    values.append(value)
+    relatives.append(value / unit)
+
+  return median(values), median(relatives)
+
+
+def main():
+  parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+  parser.add_argument("--rows", default=1000, type=int, help="Rows per result set")
+  parser.add_argument("--number", default=20000, type=int, help="Calls per timing")
+  parser.add_argument("--repeat", default=9, type=int, help="Timings per case, the median counts")
+  parser.add_argument("--baselines", default=BASELINES, help="Baselines file")
+  parser.add_argument("--save", action="store_true", help="Store these results as the new baselines")
+  parser.add_argument("--check", action="store_true", help="Exit with an error on regressions")
+  parser.add_argument("--threshold", default=0.25, type=float, help="Allowed slowdown over the baseline (0.25 = 25%%)")
+  args = parser.parse_args()
+
+  try:
+    with open(args.baselines) as baselines:
+      baseline = load(baselines)
+  except FileNotFoundError:
+    baseline = {}
+
+  relative = {}
+  failed = []
+  print(f"{'case':24} {'ns':>10} {'relative':>9} {'baseline':>9} {'change':>8}")
+
+  for name, (function, calls) in cases(make_rows(args.rows)).items():
+    value, relative[name] = measure(function, calls, args.number, args.repeat)
+    line = f"{name:24} {value:10.1f} {relative[name]:9.4f}"
+
+    if name in baseline:
+      change = relative[name] / baseline[name] - 1
+      line += f" {baseline[name]:9.4f} {change:+8.1%}"
+
+      if change > args.threshold:
+        failed.append(name)
+        line += "  REGRESSION"
+
+    print(line)
+
+  if args.save:
+    with open(args.baselines, "w") as baselines:
+      dump(relative, baselines, indent=2, sort_keys=True)
+      baselines.write("\n")
+    print(f"baselines saved to {args.baselines}")
+
+  if args.check and failed:
+    print(f"slower than {args.threshold:.0%} over the baseline: {', '.join(failed)}")
+    exit(1)
+
+
+if __name__ == "__main__":
+  main()
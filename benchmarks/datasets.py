@@ -0,0 +1,52 @@
+from os import makedirs, replace
+from os.path import exists, join
+from random import Random
+from tempfile import gettempdir
+
+from apsw import Connection
+
+
+def dataset_path(rows, columns, tables, blob_size, directory=None):
+  directory = directory or join(gettempdir(), "mysqlite-benchmarks")
+  makedirs(directory, exist_ok=True)
+  return join(directory, f"bench-{rows}r-{columns}c-{tables}t-{blob_size}b.db")
+
+
+def generate(path, rows=100000, columns=40, tables=200, blob_size=4096, seed=1):  # narrow, wide, BLOB and SHOW tables
+  if exists(path):  # built once per shape, reused afterwards
+    return path
+
+  random = Random(seed)
+  building = f"{path}.tmp"
+  db = Connection(building)
+  db.execute("PRAGMA journal_mode = OFF")
+  db.execute("PRAGMA synchronous = OFF")
+
+  with db:
+    db.execute("CREATE TABLE narrow (id INTEGER PRIMARY KEY, name VARCHAR(64), score REAL)")
+    db.executemany("INSERT INTO narrow VALUES (?, ?, ?)",
+                   ((i, f"name{i}", random.random() * 1000) for i in range(1, rows + 1)))
+    db.execute("CREATE INDEX ix_narrow_name ON narrow (name)")
+
+    definitions = ", ".join(f"c{i} {('INTEGER', 'VARCHAR(32)', 'REAL', 'DATETIME')[i % 4]}"
+                            for i in range(columns))
+    db.execute(f"CREATE TABLE wide (id INTEGER PRIMARY KEY, {definitions})")
+    values = ("?, " * columns).rstrip(", ")
+    row = [(i, f"text{i}", i * 0.5, "2020-01-01 00:00:00")[i % 4] for i in range(columns)]
+    db.executemany(f"INSERT INTO wide VALUES (?, {values})",
+                   ((i, *row) for i in range(1, rows + 1)))
+
+    db.execute("CREATE TABLE blobs (id INTEGER PRIMARY KEY, data BLOB)")
+    db.executemany("INSERT INTO blobs VALUES (?, ?)",
+                   ((i, random.randbytes(blob_size)) for i in range(1, min(rows, 10000) + 1)))
+
+    for table in range(tables):
+      db.execute(f"CREATE TABLE t{table} (id INTEGER PRIMARY KEY, code VARCHAR(16) UNIQUE, "
+                 f"parent INTEGER REFERENCES narrow (id), note TEXT)")
+      db.execute(f"CREATE INDEX ix_t{table}_parent ON t{table} (parent)")
+
+  db.execute("ANALYZE")
+  db.close()
+  replace(building, path)
+
+  return path
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from asyncio import new_event_loop
+from concurrent.futures import ProcessPoolExecutor
+from json import dump
+from logging import WARNING, basicConfig
+from multiprocessing import get_context
+from os import sysconf
+from random import Random
+from shlex import split
+from socket import create_server
+from socketserver import ThreadingTCPServer
+from threading import Thread
+from time import perf_counter
+
+from benchmarks.client import Client, ClientError
+from benchmarks.datasets import dataset_path, generate
+from mysqlite.asyncserver import AsyncServer
+from mysqlite.mysqlite import build_parser, configure
+from mysqlite.server import Server
+
+
+SCENARIOS = ("point", "scan", "blob", "show")
+
+
+def statements(scenario, random, rows, tables, scan):
+  if scenario == "point":
+    while True:
+      yield f"SELECT * FROM narrow WHERE id = {random.randint(1, rows)}"
+  elif scenario == "scan":
+    while True:
+      yield f"SELECT * FROM wide WHERE id > {random.randint(0, max(rows - scan, 0))} LIMIT {scan}"
+  elif scenario == "blob":
+    while True:
+      start = random.randint(1, max(min(rows, 10000) - 100, 1))
+      yield f"SELECT * FROM blobs WHERE id BETWEEN {start} AND {start + 99}"
+  elif scenario == "show":  # what GUI clients send when a schema is opened
+    while True:
+      table = f"t{random.randrange(tables)}"
+      yield "SHOW TABLES"
+      yield f"SHOW FULL COLUMNS FROM `{table}`"
+      yield f"SHOW INDEX FROM `{table}`"
+      yield f"SHOW TABLE STATUS LIKE '{table}'"
+      yield f"SHOW CREATE TABLE `{table}`"
+
+
+def drive(port, scenario, duration, seed, rows, tables, scan, deprecate_eof):  # runs in a client process
+  client = Client("127.0.0.1", port, deprecate_eof=deprecate_eof)
+  queries = statements(scenario, Random(seed), rows, tables, scan)
+  latencies = []
+  firsts = []
+  received = errors = 0
+
+  started = perf_counter()
+  deadline = started + duration
+
+  while perf_counter() < deadline:
+    sql = next(queries)
+    sent = perf_counter()
+
+    try:
+      _, result, first = client.query(sql)
+    except ClientError:
+      errors += 1
+      continue
+
+    latencies.append(perf_counter() - sent)
+    firsts.append(first)
+    received += len(result)
+
+  elapsed = perf_counter() - started
+  client.close()
+
+  return latencies, firsts, received, errors, elapsed
+
+
+def start_server(args):  # in this process, on a free port
+  sock = create_server(("127.0.0.1", 0))
+  port = sock.getsockname()[1]
+
+  if args.engine == "asyncio":
+    server = AsyncServer("127.0.0.1", port, args.threads, sock)
+    configure(server, args)
+    loop = new_event_loop()
+    Thread(target=loop.run_until_complete, args=(server.serve_forever(), ), daemon=True).start()
+  else:
+    server = ThreadingTCPServer(("127.0.0.1", port), Server, False)
+    server.daemon_threads = True
+    server.socket.close()
+    server.socket = sock
+    configure(server, args)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+  return port
+
+
+def percentile(values, fraction):
+  if not values:
+    return 0.0
+  values = sorted(values)
+  return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def memory():  # resident set size of this process (the server), in MB, linux only
+  try:
+    with open("/proc/self/statm") as statm:
+      return int(statm.read().split()[1]) * sysconf("SC_PAGE_SIZE") / 2 ** 20
+  except OSError:
+    return 0.0
+
+
+def run(port, scenario, args):
+  context = get_context("spawn")  # do not fork the threads of the server
+
+  with ProcessPoolExecutor(args.concurrency, mp_context=context) as executor:
+    futures = [executor.submit(drive, port, scenario, args.duration, seed, args.rows,
+                               args.tables, args.scan_rows, not args.classic_eof)
+               for seed in range(args.concurrency)]
+    results = [future.result() for future in futures]
+
+  latencies = [value for result in results for value in result[0]]
+  firsts = [value for result in results for value in result[1]]
+  elapsed = max(result[4] for result in results)
+
+  return {"scenario": scenario, "queries": len(latencies),
+          "qps": len(latencies) / elapsed,
+          "p50_ms": percentile(latencies, 0.50) * 1000,
+          "p99_ms": percentile(latencies, 0.99) * 1000,
+          "first_row_p50_ms": percentile(firsts, 0.50) * 1000,
+          "first_row_p99_ms": percentile(firsts, 0.99) * 1000,
+          "rows_per_second": sum(result[2] for result in results) / elapsed,
+          "errors": sum(result[3] for result in results),
+          "rss_mb": memory()}
+
+
+def main():
+  parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+  parser.add_argument("--scenario", nargs="+", default=list(SCENARIOS), choices=SCENARIOS, help="Scenarios to run")
+  parser.add_argument("--concurrency", default=8, type=int, help="Client processes")
+  parser.add_argument("--duration", default=10.0, type=float, help="Seconds per scenario")
+  parser.add_argument("--rows", default=100000, type=int, help="Rows in the narrow and wide tables")
+  parser.add_argument("--columns", default=40, type=int, help="Columns in the wide table")
+  parser.add_argument("--tables", default=200, type=int, help="Extra tables for metadata statements")
+  parser.add_argument("--blob-size", default=4096, type=int, help="Bytes per BLOB")
+  parser.add_argument("--scan-rows", default=1000, type=int, help="Rows per scan query")
+  parser.add_argument("--directory", help="Where generated databases are kept (default: temp dir)")
+  parser.add_argument("--classic-eof", action="store_true", help="Clients do not ask for CLIENT_DEPRECATE_EOF")
+  parser.add_argument("--engine", default="threading", choices=["threading", "asyncio"], help="Server engine")
+  parser.add_argument("--server", default="", help="Extra server options, e.g. \"--pool-mode query\"")
+  parser.add_argument("--json", help="Also write the results to this file")
+  args = parser.parse_args()
+
+  basicConfig(level=WARNING)
+  path = dataset_path(args.rows, args.columns, args.tables, args.blob_size, args.directory)
+  print(f"database: {path}")
+  generate(path, args.rows, args.columns, args.tables, args.blob_size)
+
+  options = build_parser().parse_args(["--filename", path, "--engine", args.engine, "--quiet",
+                                       *split(args.server)])
+  port = start_server(options)
+  results = []
+
+  print(f"{'scenario':8} {'queries':>8} {'qps':>9} {'p50 ms':>8} {'p99 ms':>8} "
+        f"{'ttfr p50':>8} {'ttfr p99':>8} {'rows/s':>10} {'errors':>6} {'rss MB':>7}")
+
+  for scenario in args.scenario:
+    result = run(port, scenario, args)
+    results.append(result)
+    print(f"{scenario:8} {result['queries']:8} {result['qps']:9.1f} {result['p50_ms']:8.2f} "
+          f"{result['p99_ms']:8.2f} {result['first_row_p50_ms']:8.2f} {result['first_row_p99_ms']:8.2f} "
+          f"{result['rows_per_second']:10.0f} {result['errors']:6} {result['rss_mb']:7.1f}")
+
+  if args.json:
+    with open(args.json, "w") as output:
+      dump({"options": vars(args), "results": results}, output, indent=2)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
+from io import BytesIO
+from timeit import repeat
+
+from mysqlite.definitions import FieldType
+from mysqlite.utils import column_converters, pack_resstring, pack_row
+
+
+META = (("id", "INTEGER", FieldType.LONGLONG, 21, 0),
+        ("name", "VARCHAR(64)", FieldType.VAR_STRING, 64, 0),
+        ("email", "TEXT", FieldType.VAR_STRING, 2 ** 16 - 1, 0),
+        ("score", "REAL", FieldType.DOUBLE, 53, 0),
+        ("balance", "DECIMAL(10,2)", FieldType.DECIMAL, 10, 2),
+        ("created", "DATETIME", FieldType.DATETIME, 19, 0),
+        ("avatar", "BLOB", FieldType.BLOB, 2 ** 24 - 1, 0),
+        ("notes", "TEXT", FieldType.VAR_STRING, 2 ** 16 - 1, 0))
+
+
+def make_rows(count):
+  rows = []
+
+  for i in range(count):
+    notes = None if i % 3 else "lorem ipsum " * (i % 40)
+    rows.append((i, f"user{i}", f"user{i}@example.com", i * 1.25, i * 100,
+                 "2020-01-01 00:00:00", bytes(i % 300), notes))
+
+  return rows
+
+
+def encode_legacy(rows):
+  for row in rows:
+    payload = BytesIO()
+
+    for value in row:
+      payload.write(pack_resstring(value))
+
+    payload.getvalue()
+
+
+def encode_batched(rows, converters):
+  for row in rows:
+    pack_row(row, converters)
+
+
+def main():
+  parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+  parser.add_argument("--rows", default=10000, type=int, help="Rows per run")
+  parser.add_argument("--repeat", default=5, type=int, help="Number of runs")
+  args = parser.parse_args()
+
+  converters = column_converters(META)
+  rows = make_rows(args.rows)
+
+  for row in rows[:500]:  # sanity check, both paths must be byte-identical
+    legacy = b"".join(pack_resstring(value) for value in row)
+    assert legacy == pack_row(row, converters), row
+
+  legacy = min(repeat(lambda: encode_legacy(rows), number=1, repeat=args.repeat))
+  batched = min(repeat(lambda: encode_batched(rows, converters), number=1, repeat=args.repeat))
+
+  print(f"rows={args.rows} columns={len(META)}")
+  print(f"pack_resstring: {legacy * 1e6 / args.rows:8.2f} us/row")
+  print(f"pack_row:       {batched * 1e6 / args.rows:8.2f} us/row")
+  print(f"speedup:        {legacy / batched:8.2f}x")
+
+
+if __name__ == "__main__":
+  main()
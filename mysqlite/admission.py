@@ -0,0 +1,119 @@
+from asyncio import get_running_loop, wait
+from threading import Condition, Thread
+from time import monotonic, sleep
+
+from mysqlite.definitions import Command
+from mysqlite.server import connections
+
+
+def _wake(future):
+  if not future.done():
+    future.set_result(None)
+
+
+class Admission:  # caps open sessions and closes the ones idle for too long
+  interval = 1.0  # seconds between sweeps of the connections registry
+
+  def __init__(self, maximum=0, wait=0, connect_timeout=0, wait_timeout=0, interactive_timeout=0):
+    self.maximum = maximum  # 0 = unlimited
+    self.wait = wait  # seconds a newcomer waits for a free slot
+    self.connect_timeout = connect_timeout  # timeouts in seconds, 0 = never
+    self.wait_timeout = wait_timeout
+    self.interactive_timeout = interactive_timeout
+    self.active = 0
+    self.condition = Condition()
+    self.waiters = []  # futures of asyncio sessions queued for a slot
+    self.stats = {"Connection_errors_max_connections": 0, "Connections_queued": 0,
+                  "Connections_reaped": 0, "Max_used_connections": 0}
+
+  def _free(self):  # called with the condition held
+    return not self.maximum or self.active < self.maximum
+
+  def _admit(self):  # called with the condition held
+    self.active += 1
+    self.stats["Max_used_connections"] = max(self.stats["Max_used_connections"], self.active)
+    return True
+
+  def enter(self):
+    with self.condition:
+      if not self._free():
+        self.stats["Connections_queued"] += 1
+
+        if not self.condition.wait_for(self._free, self.wait):
+          self.stats["Connection_errors_max_connections"] += 1
+          return False
+
+      return self._admit()
+
+  async def enter_async(self):  # as enter(), waiting on the event loop instead of a worker thread
+    loop = get_running_loop()
+    deadline = loop.time() + self.wait
+
+    with self.condition:
+      if self._free():
+        return self._admit()
+
+      self.stats["Connections_queued"] += 1
+
+    while True:
+      future = loop.create_future()
+
+      with self.condition:
+        if self._free():
+          return self._admit()
+
+        self.waiters.append(future)
+
+      done, _ = await wait([future], timeout=max(deadline - loop.time(), 0))
+
+      if not done:
+        with self.condition:
+          if future in self.waiters:
+            self.waiters.remove(future)
+
+          self.stats["Connection_errors_max_connections"] += 1
+          return False
+
+  def leave(self):
+    with self.condition:
+      self.active -= 1
+      self.condition.notify()
+
+      for future in self.waiters:  # each one checks again, a late one just waits more
+        future.get_loop().call_soon_threadsafe(_wake, future)
+
+      self.waiters.clear()
+
+  def timeout(self, interactive):  # for a session that just logged in
+    return self.interactive_timeout if interactive else self.wait_timeout
+
+  def reap(self):
+    now = monotonic()
+
+    for connection in list(connections.values()):
+      session = connection["session"]
+
+      if connection["command"] == Command.SLEEP.value:
+        timeout = session.wait_timeout
+      elif connection["command"] == Command.CONNECT.value:  # handshake never answered
+        timeout = self.connect_timeout
+      else:
+        continue
+
+      if timeout and now - connection["time"] > timeout and not session.killed:
+        session.interrupt(True)
+
+        with self.condition:
+          self.stats["Connections_reaped"] += 1
+
+  def _sweep(self):
+    while True:
+      sleep(self.interval)
+      self.reap()
+
+  def start(self):  # always, timeouts can be raised from 0 with SET GLOBAL
+    Thread(target=self._sweep, name="Reaper", daemon=True).start()
+
+  def status(self):
+    with self.condition:
+      return dict(self.stats)
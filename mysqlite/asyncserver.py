@@ -0,0 +1,138 @@
+from asyncio import IncompleteReadError, get_running_loop, \
+  run_coroutine_threadsafe, start_server
+from concurrent.futures import ThreadPoolExecutor
+from struct import unpack
+from traceback import print_exc
+
+from mysqlite.compression import CompressionError, read_compressed_header
+from mysqlite.server import Session
+from mysqlite.utils import MAX_PACKET, PacketTooLarge, Payload
+
+
+class StreamWriter:  # lets Session.send_packets write from executor threads
+  def __init__(self, loop, writer):
+    self.loop = loop
+    self.writer = writer
+
+  async def _write(self, data):
+    self.writer.write(data)
+    await self.writer.drain()
+
+  def write(self, data):
+    run_coroutine_threadsafe(self._write(data), self.loop).result()
+
+
+class CompressedStreamReader:  # yields the packets inside compressed frames
+  def __init__(self, session, reader):
+    self.session = session
+    self.reader = reader
+    self.pending = b""
+
+  async def readexactly(self, size):
+    while len(self.pending) < size:
+      length, number, original = read_compressed_header(await self.reader.readexactly(7))
+      payload = await self.reader.readexactly(length)
+      self.pending += self.session.inflate(payload, number, original)
+
+    data, self.pending = self.pending[:size], self.pending[size:]
+    return data
+
+
+class AsyncSession(Session):
+  def __init__(self, server, client_address, reader, wfile):
+    self.server = server
+    self.client_address = client_address
+    self.reader = reader
+    self.wfile = wfile
+    self.request = wfile.writer.get_extra_info("socket")  # as in socketserver, for KILL
+    self.entered = False  # admission is awaited on the loop, before open() runs in a thread
+
+  def admit(self):
+    return self.entered
+
+  def start_compression(self):
+    super().start_compression()
+    self.reader = CompressedStreamReader(self, self.reader)
+
+
+class AsyncServer:
+  identifiers = None
+  pool = None
+  schemas = None
+  cache = None
+  filename = None
+  flush_bytes = 0
+  flush_rows = 0
+  max_prepared = 0
+  compression = None
+  max_allowed_packet = 0
+  counters = None
+  long_query_time = 0
+  slow_log = None
+  metrics = None
+  max_execution_time = 0
+  admission = None
+  back_log = 100
+
+  def __init__(self, address, port, threads, sock=None):
+    self.address = address
+    self.port = port
+    self.sock = sock
+    self.executor = ThreadPoolExecutor(threads, "Worker")
+
+  async def read_packet(self, session):
+    chunks = []
+    total = 0
+
+    while True:  # payloads of 16M or more come in several packets
+      header = unpack("<I", await session.reader.readexactly(4))[0]
+      length, session.number = header & 0xffffff, header >> 24
+      total += length
+
+      if total > self.max_allowed_packet:
+        raise PacketTooLarge()
+
+      chunks.append(await session.reader.readexactly(length))
+
+      if length < MAX_PACKET:
+        session.counters["Bytes_received"] += total + 4 * len(chunks)
+        return Payload(chunks[0] if len(chunks) == 1 else b"".join(chunks))
+
+  async def handle(self, reader, writer):
+    loop = get_running_loop()
+    session = AsyncSession(self, writer.get_extra_info("peername")[:2], reader,
+                           StreamWriter(loop, writer))
+
+    try:
+      session.entered = await self.admission.enter_async()
+
+      if not await loop.run_in_executor(self.executor, session.open):
+        return
+
+      while True:  # idle connections only wait here, without a thread
+        payload = await self.read_packet(session)
+
+        if not await loop.run_in_executor(self.executor, session.dispatch, payload):
+          break
+    except (PacketTooLarge, CompressionError) as e:
+      await loop.run_in_executor(self.executor, session.send_exception, e)
+    except (IncompleteReadError, ConnectionError):
+      pass
+    except Exception:
+      print_exc()
+    finally:
+      session.close()
+      writer.close()
+
+  async def serve_forever(self):
+    if self.sock is None:
+      server = await start_server(self.handle, self.address, self.port,
+                                  reuse_address=True, backlog=self.back_log)
+    else:
+      server = await start_server(self.handle, sock=self.sock)
+
+    async with server:
+      await server.serve_forever()
+
+  def shutdown(self):
+    self.executor.shutdown(wait=False)
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from re import IGNORECASE, compile
+from threading import Lock
+
+from mysqlite.parser import QUOTED
+
+
+WHITESPACE = compile(r"\s+")
+VOLATILE = compile(r"\b(?:random|randomblob|changes|total_changes|last_insert_rowid|"
+                   r"current_date|current_time|current_timestamp)\b|'now'|\"now\"|"
+                   r"\b(?:date|time|datetime|julianday|unixepoch)\s*\(\s*\)", IGNORECASE)  # no argument is now
+
+
+def normalize(query):
+  parts = QUOTED.split(query)
+
+  for i in range(0, len(parts), 2):  # collapse whitespace outside quotes only
+    parts[i] = WHITESPACE.sub(" ", parts[i])
+
+  return "".join(parts).strip()
+
+
+class ResultCache:
+  def __init__(self, version, size, entry):
+    self.version = version  # schema -> version of the data its results depend on
+    self.size = size  # bytes for all entries
+    self.entry = entry  # bytes for a single result
+    self.used = 0
+    self.entries = OrderedDict()
+    self.lock = Lock()
+    self.versions = {}  # schema -> last version seen
+    self.stats = {"hits": 0, "misses": 0, "inserts": 0, "not_cached": 0, "prunes": 0,
+                  "invalidations": 0}
+
+  def key(self, schema, capabilities, query):
+    if VOLATILE.search(query):
+      with self.lock:
+        self.stats["not_cached"] += 1
+      return None
+
+    return schema, capabilities, normalize(query)
+
+  def _validate(self, schema):  # drops the results of a schema whose data changed
+    version = self.version(schema)
+
+    if self.versions.setdefault(schema, version) != version:
+      self.versions[schema] = version
+
+      for key in [key for key in self.entries if key[0] == schema]:
+        self.used -= self.entries.pop(key)[1]
+
+      self.stats["invalidations"] += 1
+
+    return version
+
+  def get(self, key):  # returns cached packets (or None) and the data version
+    with self.lock:
+      version = self._validate(key[0])
+      entry = self.entries.get(key)
+
+      if entry is None:
+        self.stats["misses"] += 1
+        return None, version
+
+      self.entries.move_to_end(key)
+      self.stats["hits"] += 1
+      return entry[0], version
+
+  def put(self, key, packets, version):
+    size = sum(len(packet) for packet in packets)
+
+    with self.lock:
+      if size > self.entry or size > self.size:
+        self.stats["not_cached"] += 1
+        return
+
+      if version != self._validate(key[0]):  # data changed while the query was running
+        return
+
+      if key in self.entries:
+        self.used -= self.entries.pop(key)[1]
+
+      while self.entries and self.used + size > self.size:
+        self.used -= self.entries.popitem(last=False)[1][1]
+        self.stats["prunes"] += 1
+
+      self.entries[key] = (packets, size)
+      self.used += size
+      self.stats["inserts"] += 1
+
+  def abandon(self):  # a result outgrew the entry size while it was sent
+    with self.lock:
+      self.stats["not_cached"] += 1
+
+  def status(self):
+    with self.lock:
+      return dict(self.stats, queries_in_cache=len(self.entries),
+                  free_memory=self.size - self.used)
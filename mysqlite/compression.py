@@ -0,0 +1,106 @@
+from io import BytesIO
+from struct import unpack
+from threading import Lock
+from zlib import compress, decompressobj, error
+
+from mysqlite.utils import MAX_PACKET, pack_byte, pack_long
+
+
+def read_compressed_header(header):
+  length = unpack("<I", header[:3] + b"\0")[0]
+  original = unpack("<I", header[4:7] + b"\0")[0]
+  return length, header[3], original
+
+
+class CompressionError(Exception):
+  def __init__(self, message="Couldn't uncompress communication packet"):
+    super().__init__(message)
+
+
+class Compression:
+  def __init__(self, level=6, minimum=50):
+    self.level = level
+    self.minimum = minimum  # smaller payloads are framed but not compressed
+    self.lock = Lock()
+    self.stats = {"bytes_sent_uncompressed": 0, "bytes_sent_compressed": 0,
+                  "bytes_received_uncompressed": 0,
+                  "bytes_received_compressed": 0}
+
+  def pack(self, data, number):
+    frames = []
+    before = after = 0
+
+    view = memoryview(data)
+
+    for offset in range(0, max(len(data), 1), MAX_PACKET):
+      chunk = view[offset:offset + MAX_PACKET]
+      original = len(chunk)
+
+      if original >= self.minimum:
+        packed = compress(chunk, self.level)
+
+        if len(packed) >= original:  # incompressible, send as is
+          packed, original = chunk, 0
+      else:
+        packed, original = chunk, 0
+
+      number = (number + 1) & 0xff
+      frames.append(pack_long(len(packed))[:-1] + pack_byte(number) + pack_long(original)[:-1])
+      frames.append(packed)
+      before += len(chunk)
+      after += len(packed) + 7
+
+    with self.lock:
+      self.stats["bytes_sent_uncompressed"] += before
+      self.stats["bytes_sent_compressed"] += after
+
+    return b"".join(frames), number
+
+  def unpack(self, payload, original):
+    if original > MAX_PACKET + 4:  # a frame holds one packet and its header at most
+      raise CompressionError()
+
+    data = payload
+
+    if original:  # inflated no further than the size the header announces
+      inflater = decompressobj()
+
+      try:
+        data = inflater.decompress(payload, original)
+      except error:
+        raise CompressionError() from None
+
+      if len(data) != original or not inflater.eof or inflater.unconsumed_tail or inflater.unused_data:
+        raise CompressionError()
+
+    with self.lock:
+      self.stats["bytes_received_uncompressed"] += len(data)
+      self.stats["bytes_received_compressed"] += len(payload) + 7
+
+    return data
+
+  def status(self):
+    with self.lock:
+      return dict(self.stats)
+
+
+class CompressedReader:  # file-like, yields the packets inside compressed frames
+  def __init__(self, session, raw):
+    self.session = session
+    self.raw = raw
+    self.buffer = BytesIO()
+
+  def read(self, size):
+    data = self.buffer.read(size)
+
+    while len(data) < size:
+      header = self.raw.read(7)
+
+      if len(header) < 7:
+        break
+
+      length, number, original = read_compressed_header(header)
+      self.buffer = BytesIO(self.session.inflate(self.raw.read(length), number, original))
+      data += self.buffer.read(size - len(data))
+
+    return data
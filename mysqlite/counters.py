@@ -0,0 +1,118 @@
+from threading import Lock
+from time import monotonic
+
+from mysqlite.definitions import Command
+
+
+COMMANDS = {  # classified statements, named as MySQL names their Com_ counters
+  "help": "help",
+  "kill": "kill",
+  "set_variable": "set_option",
+  "show_character_set": "show_charsets",
+  "show_collation": "show_collations",
+  "show_columns": "show_fields",
+  "show_create_database": "show_create_db",
+  "show_create_table": "show_create_table",
+  "show_databases": "show_databases",
+  "show_engines": "show_storage_engines",
+  "show_index": "show_keys",
+  "show_processlist": "show_processlist",
+  "show_status": "show_status",
+  "show_table_status": "show_table_status",
+  "show_tables": "show_tables",
+  "show_variables": "show_variables",
+  "use": "change_db",
+}
+
+KEYWORDS = {  # leading keyword of everything else
+  "ALTER": "alter_table",
+  "BEGIN": "begin",
+  "COMMIT": "commit",
+  "CREATE": "create_table",
+  "DELETE": "delete",
+  "DROP": "drop_table",
+  "INSERT": "insert",
+  "REPLACE": "replace",
+  "ROLLBACK": "rollback",
+  "SELECT": "select",
+  "SET": "set_option",
+  "UPDATE": "update",
+}
+
+PROTOCOL = {  # protocol commands with a counter of their own
+  Command.INIT_DB: "Com_change_db",
+  Command.PROCESS_KILL: "Com_kill",
+  Command.STMT_CLOSE: "Com_stmt_close",
+  Command.STMT_EXECUTE: "Com_stmt_execute",
+  Command.STMT_PREPARE: "Com_stmt_prepare",
+  Command.STMT_RESET: "Com_stmt_reset",
+  Command.STMT_SEND_LONG_DATA: "Com_stmt_send_long_data",
+}
+
+QUESTIONS = {Command.QUERY, Command.STMT_PREPARE, Command.STMT_EXECUTE}
+
+STATEMENTS = {f"Com_{name}" for name in (*COMMANDS.values(), *KEYWORDS.values())}
+
+NAMES = ("Bytes_received", "Bytes_sent", "Questions", "Rows_sent", "Slow_queries",
+         *sorted(STATEMENTS.union(PROTOCOL.values())))
+
+
+def command_counter(statement):
+  if statement.function is not None:
+    name = COMMANDS.get(statement.function)
+  else:
+    name = KEYWORDS.get(statement.keyword)
+
+  return f"Com_{name}" if name else None
+
+
+def statement_class(statement):  # bounded set of labels for the metrics
+  if statement.function is not None:
+    return statement.function
+  if statement.keyword in KEYWORDS:
+    return statement.keyword.lower()
+  return "other"
+
+
+class Counters:  # sessions count without locking, totals are folded in on close
+  def __init__(self):
+    self.started = monotonic()
+    self.lock = Lock()
+    self.totals = dict.fromkeys(NAMES, 0)
+    self.sessions = {}
+    self.stats = {"Connections": 0, "Aborted_connects": 0, "Aborted_clients": 0}
+
+  def connect(self, identifier):
+    counters = dict.fromkeys(NAMES, 0)  # fixed keys, safe to sum while updated
+
+    with self.lock:
+      self.stats["Connections"] += 1
+      self.sessions[identifier] = counters
+
+    return counters
+
+  def disconnect(self, identifier, connected, aborted):
+    with self.lock:
+      counters = self.sessions.pop(identifier, None)
+
+      if counters is not None:
+        for name, value in counters.items():
+          self.totals[name] += value
+
+      if not connected:
+        self.stats["Aborted_connects"] += 1
+      elif aborted:
+        self.stats["Aborted_clients"] += 1
+
+  def status(self, counters=None):  # session values if given, global otherwise
+    with self.lock:
+      values = dict(self.stats, Uptime=int(monotonic() - self.started))
+
+      if counters is None:
+        counters = dict(self.totals)
+        for session in self.sessions.values():
+          for name, value in session.items():
+            counters[name] += value
+
+    values.update(counters)
+    return values
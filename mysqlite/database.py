@@ -1,17 +1,171 @@
-from re import match
+from collections import OrderedDict, deque
+from os.path import abspath
+from re import DOTALL, IGNORECASE, compile, escape, match
+from threading import Condition, Lock
+from time import monotonic
+from urllib.parse import quote
 
-from apsw import SQLITE_ACCESS_READ, Connection
+from apsw import SQLITE_ACCESS_READ, SQLITE_LIMIT_ATTACHED, \
+  SQLITE_OPEN_READONLY, SQLITE_OPEN_SHAREDCACHE, SQLITE_OPEN_URI, \
+  SQLITE_TRACE_PROFILE, Connection, ExecTraceAbort
 
 from mysqlite.definitions import Charset, FieldType
+from mysqlite.statistics import Statistics
+
+
+class Catalog:  # table metadata shared by every connection to the same file
+  catalogs = {}
+  lock = Lock()
+
+  def __init__(self):
+    self.version = None
+    self.table_list = None
+    self.column_lists = {}
+    self.lock = Lock()
+
+  @classmethod
+  def get(cls, filename):
+    with cls.lock:
+      return cls.catalogs.setdefault(filename, cls())
+
+  @classmethod
+  def release(cls, filename):  # when no pool serves the file anymore
+    with cls.lock:
+      cls.catalogs.pop(filename, None)
+
+  def _refresh(self, db):
+    version = db._schema_version()
+
+    if version != self.version:
+      self.version = version
+      self.table_list = None
+      self.column_lists = {}
+
+  def tables(self, db):
+    with self.lock:
+      self._refresh(db)
+
+      if self.table_list is None:
+        self.table_list = db._load_tables()
+
+      return self.table_list
+
+  def columns(self, db, table):
+    with self.lock:
+      self._refresh(db)
+
+      if table not in self.column_lists:
+        self.column_lists[table] = db._load_columns(table)
+
+      return self.column_lists[table]
+
+
+class Settings:  # how connections are opened and tuned, the same for every file
+  reported = ("journal_mode", "locking_mode", "page_size", "page_count", "cache_size",
+              "mmap_size", "temp_store", "query_only")
+
+  def __init__(self, immutable=False, shared_cache=False, pragmas=()):
+    self.immutable = immutable  # the file never changes while served, no locks or change checks
+    self.shared_cache = shared_cache
+    self.pragmas = pragmas  # (name, value) pairs run on every new connection
+
+  def name(self, filename):  # for Connection and ATTACH
+    if self.immutable and filename != ":memory:" and not filename.startswith("file:"):
+      return f"file:{quote(abspath(filename))}?immutable=1"
+    return filename
+
+  def connect(self, filename):
+    flags = SQLITE_ACCESS_READ | SQLITE_OPEN_URI
+
+    if self.immutable:
+      flags = SQLITE_OPEN_READONLY | SQLITE_OPEN_URI
+    if self.shared_cache:
+      flags |= SQLITE_OPEN_SHAREDCACHE
+
+    connection = Connection(self.name(filename), flags)
+
+    for name, value in self.pragmas:
+      connection.execute(f"PRAGMA {name} = {value}")
+
+    return connection
+
+  def report(self, filename):  # effective values, as a new connection sees them
+    connection = self.connect(filename)
+
+    try:
+      values = {"immutable": int(self.immutable), "shared_cache": int(self.shared_cache)}
+      for name in dict.fromkeys(self.reported + tuple(name for name, _ in self.pragmas)):
+        row = connection.execute(f"PRAGMA {name}").fetchone()
+        values[name] = row[0] if row else None
+      return values
+    finally:
+      connection.close()
 
 
 class Database:
   inst = None
+  catalog = None
+  statistics = None
+  statement_status = None
+  deadline = None  # monotonic time after which the running statement is interrupted
+  schemas = None
+  attached = None
+  settings = Settings()
+  generation = 0  # of the pool that created it
   version = ""
 
-  def __init__(self, filename):
-    self.inst = Connection(filename, SQLITE_ACCESS_READ)
+  def __init__(self, filename, profile=False, schemas=None, settings=None):
+    if settings is not None:
+      self.settings = settings
+
+    self.inst = self.settings.connect(filename)
     self.version = "4.1.25-SQLite"
+    self.catalog = Catalog.get(filename)
+    self.statistics = Statistics.get(filename, self.settings)
+
+    if schemas is not None:  # other files of the data directory, attached when named
+      self.schemas = schemas
+      self.attached = OrderedDict()
+
+    if profile:  # keep the counters of the last finished statement, for the slow log
+      self.inst.trace_v2(SQLITE_TRACE_PROFILE, self._profile)
+
+  def _profile(self, event):
+    self.statement_status = event["stmt_status"]
+
+  def _progress(self):
+    return monotonic() > self.deadline  # true interrupts the statement
+
+  def limit(self, seconds):  # None lifts it, the handler only runs while limited
+    if seconds:
+      self.deadline = monotonic() + seconds
+      self.inst.set_progress_handler(self._progress, 1000)
+    elif self.deadline is not None:
+      self.deadline = None
+      self.inst.set_progress_handler(None)
+
+  def timed_out(self):
+    return self.deadline is not None and monotonic() > self.deadline
+
+  def interrupt(self):  # from another thread, running statements fail with InterruptError
+    self.inst.interrupt()
+
+  def close(self):
+    self.inst.close(True)
+
+  def _attach(self, query):
+    for name, filename in self.schemas.referenced(query).items():
+      if self.attached.get(name) == filename:
+        self.attached.move_to_end(name)
+        continue
+
+      if name in self.attached or len(self.attached) >= self.inst.limit(SQLITE_LIMIT_ATTACHED):
+        old = name if name in self.attached else next(iter(self.attached))
+        self.inst.execute("DETACH DATABASE ?", (old, ))
+        del self.attached[old]
+
+      self.inst.execute("ATTACH DATABASE ? AS ?", (self.settings.name(filename), name))
+      self.attached[name] = filename
 
   def _execute(self, query, params=None):
     cursor = self.inst.cursor()
@@ -20,9 +174,17 @@ class Database:
     return cursor.execute(query, params)
 
   def get_databases(self):
+    if self.schemas is not None:
+      return self.schemas.names()
     return ["main"]
 
+  def _schema_version(self):
+    return self._execute("PRAGMA schema_version").fetchone()[0]
+
   def get_tables(self):
+    return self.catalog.tables(self)
+
+  def _load_tables(self):
     tables = []
     query = "SELECT name AS TABLE_NAME FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
 
@@ -101,6 +263,25 @@ class Database:
     meta = (("Variable_name", "VARCHAR(30)"), ("Value", "VARCHAR(255)"))
     return self.expand_meta(meta), []
 
+  def show_status(self, values, pattern=None):
+    meta = (("Variable_name", "VARCHAR(64)"), ("Value", "VARCHAR(255)"))
+    data = []
+    like = self._like(pattern)
+
+    for name, value in sorted(values.items()):
+      if like is None or like.match(name):
+        data.append((name, value))
+
+    return self.expand_meta(meta), data
+
+  def _like(self, pattern):
+    if pattern is None:
+      return None
+
+    expression = "".join(".*" if char == "%" else "." if char == "_" else escape(char)
+                         for char in pattern)
+    return compile(f"{expression}$", IGNORECASE | DOTALL)
+
   def _index_list(self, table):
     indexes = {}
 
@@ -122,6 +303,9 @@ class Database:
     return foreigns
 
   def _column_list(self, table):
+    return self.catalog.columns(self, table)
+
+  def _load_columns(self, table):
     indexes = self._index_list(table)
     foreigns = self._foreign_list(table)
     columns = []
@@ -146,23 +330,12 @@ class Database:
 
     return columns
 
-  def _calc_cardinality(self, table, column):
-    return self._execute(f"SELECT COUNT(DISTINCT([{column}])) FROM [{table}]").fetchone()[0]
-
-  def _count_rows(self, table):
-    return self._execute(f"SELECT COUNT(1) FROM [{table}]").fetchone()[0]
-
-  def _next_id(self, table):
-    primary = None
-
-    for column in self._column_list(table):
-      if column["serial"]:
-        primary = column["name"]
-        break
-    else:
-      return None
+  def _statistics(self, table):
+    columns = self._column_list(table)
+    serial = next((column["name"] for column in columns if column["serial"]), None)
+    indexes = [(column["index"], column["name"]) for column in columns if column["index"]]
 
-    return self._execute(f"SELECT COUNT([{primary}]) FROM [{table}]").fetchone()[0] + 1
+    return self.statistics.table(self, table, serial, indexes)
 
   def show_indexes(self, table):
     meta = (("Table", "VARCHAR(64)"), ("Non_unique", "INTEGER"),
@@ -173,6 +346,7 @@ class Database:
             ("Index_type", "VARCHAR(16)"), ("Comment", "VARCHAR(255)"),
             ("Index_comment", "VARCHAR(255)"))
     data = []
+    stats = self._statistics(table)
 
     for column in self._column_list(table):
       if not column["index"]:
@@ -181,7 +355,7 @@ class Database:
       unique = int(not column["unique"])
       key = "PRIMARY" if column["primary"] else column["index"]
       collation = "A" if column["order"] == 1 else None
-      cardinality = self._calc_cardinality(table, column["name"])
+      cardinality = stats["cardinality"].get(column["index"])
       null = "YES" if column["nullable"] else None
 
       item = (table, unique, key, 1, column["name"], collation,
@@ -221,14 +395,20 @@ class Database:
             ("Collation", "VARCHAR(32)"), ("Checksum", "INTEGER"),
             ("Create_options", "VARCHAR(255)"), ("Comment", "VARCHAR(80)"))
     data = []
-    tables = [name] if name else self.get_tables()
+    like = self._like(name)
 
-    for table in tables:
-      rows = self._count_rows(table)
+    for table in self.get_tables():
+      if like is not None and not like.match(table):
+        continue
+
+      stats = self._statistics(table)
+      rows = stats["rows"]
+      data_length = stats["data_length"]
+      average = data_length // rows if rows and data_length else 0
       collation = Charset.UTF8_GENERAL_CI.name.lower()
-      auto = self._next_id(table)
-      data.append((table, "SQLite", 9, "Dynamic", rows, 0, 0, None, 0, 0,
-                   auto, None, None, None, collation, None, "", ""))
+      data.append((table, "SQLite", 9, "Dynamic", rows, average, data_length,
+                   None, stats["index_length"], 0, stats["auto_increment"],
+                   None, None, None, collation, None, "", ""))
 
     return self.expand_meta(meta), data
 
@@ -346,7 +526,150 @@ class Database:
 
     return new_meta
 
+  def _preparetrace(self, cursor, sql, bindings):
+    self._meta = cursor.getdescription()
+    return False  # abort before the first step, only the columns are needed
+
+  def prepare(self, query, params=0):
+    if self.schemas is not None:
+      self._attach(query)
+
+    cursor = self.inst.cursor()
+    cursor.setexectrace(self._preparetrace)
+    self._meta = ()
+
+    try:
+      cursor.execute(query, (None, ) * params)
+    except ExecTraceAbort:
+      pass
+
+    return self.expand_meta(self._meta)
+
   def execute(self, query, params=None):
+    if self.schemas is not None:
+      self._attach(query)
+
     results = self._execute(query, params)
 
-    return self.expand_meta(self._meta), results.fetchall()
+    return self.expand_meta(self._meta), results  # rows are fetched lazily
+
+
+class PoolTimeout(Exception):
+  pass
+
+
+class Pool:
+  check_interval = 30  # seconds idle before a connection is checked again
+
+  def __init__(self, filename, minimum=1, maximum=0, idle=8, timeout=10,
+               per_query=False, profile=False, schemas=None, settings=None):
+    self.filename = filename
+    self.minimum = minimum
+    self.maximum = maximum  # 0 = unlimited
+    self.idle = max(idle, minimum)
+    self.timeout = timeout
+    self.per_query = per_query
+    self.profile = profile
+    self.schemas = schemas
+    self.settings = settings
+    self.generation = 0  # bumped when filename points somewhere else
+    self.closed = False
+    self.available = deque()
+    self.size = 0
+    self.condition = Condition()
+    self.stats = {"created": 0, "reused": 0, "waits": 0, "timeouts": 0,
+                  "discarded": 0, "checkouts": 0, "switches": 0}
+
+    for _ in range(minimum):
+      self.available.append((self._create(), monotonic()))
+
+  def _create(self):
+    db = Database(self.filename, self.profile, self.schemas, self.settings)
+    db.generation = self.generation
+    self.size += 1
+    self.stats["created"] += 1
+    return db
+
+  def _discard(self, db):
+    self.size -= 1
+    self.stats["discarded"] += 1
+    db.close()
+
+  def _healthy(self, db):
+    try:
+      db.inst.execute("SELECT 1").fetchall()
+      return True
+    except Exception:
+      return False
+
+  def acquire(self):
+    with self.condition:
+      self.stats["checkouts"] += 1
+
+      while True:
+        while self.available:
+          db, since = self.available.pop()  # most recently used, warmest cache
+
+          if monotonic() - since < self.check_interval or self._healthy(db):
+            self.stats["reused"] += 1
+            return db
+
+          self._discard(db)
+
+        if not self.maximum or self.size < self.maximum:
+          return self._create()
+
+        self.stats["waits"] += 1
+
+        if not self.condition.wait(self.timeout):
+          self.stats["timeouts"] += 1
+          raise PoolTimeout("Too many connections")
+
+  def release(self, db):
+    with self.condition:
+      if not self.closed and db.generation == self.generation and \
+         len(self.available) < self.idle and db.inst.getautocommit():
+        self.available.append((db, monotonic()))
+      else:  # keep only a bounded set of clean connections warm
+        self._discard(db)
+
+      self.condition.notify()
+
+  def stale(self, db):  # opened before the last switch
+    return db.generation != self.generation
+
+  def switch(self, filename):  # new checkouts get filename, busy connections are dropped on release
+    with self.condition:
+      previous, self.filename = self.filename, filename
+      self.generation += 1
+
+      while self.available:
+        self._discard(self.available.pop()[0])
+
+      for _ in range(self.minimum):
+        self.available.append((self._create(), monotonic()))
+
+      self.stats["switches"] += 1
+
+    if previous != filename:  # nothing but busy connections keeps the old file open now
+      Catalog.release(previous)
+      Statistics.release(previous)
+
+  def busy(self):
+    with self.condition:
+      return self.size - len(self.available)
+
+  def close(self):  # idle connections now, busy ones when they come back
+    with self.condition:
+      self.closed = True
+
+      while self.available:
+        self._discard(self.available.pop()[0])
+
+    Catalog.release(self.filename)
+    Statistics.release(self.filename)
+
+  def status(self):
+    with self.condition:
+      return dict(self.stats, size=self.size, idle=len(self.available),
+                  busy=self.size - len(self.available))
@@ -13,6 +13,7 @@ class Capability(IntFlag):
   TRANSACTIONS = 0x2000  # Client knows about transactions
   SECURE_CONNECTION = 0x8000  # New 4.1 authentication
   CONNECT_ATTRS = 0x100000  # Supports connection attributes
+  DEPRECATE_EOF = 0x1000000  # Client no longer needs EOF packets
 
 
 class Command(IntEnum):
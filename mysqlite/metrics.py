@@ -0,0 +1,172 @@
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import info
+from threading import Lock, Thread
+
+from mysqlite.definitions import Command
+from mysqlite.server import connections
+
+
+LATENCY = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROWS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+
+class Histogram:  # written by a single session, merged under the Metrics lock
+  def __init__(self, bounds):
+    self.bounds = bounds
+    self.buckets = [0] * (len(bounds) + 1)
+    self.sum = 0
+
+  def observe(self, value):
+    self.buckets[bisect_left(self.bounds, value)] += 1  # bounds are inclusive, as "le"
+    self.sum += value
+
+  def merge(self, other):
+    for index, value in enumerate(other.buckets):
+      self.buckets[index] += value
+    self.sum += other.sum
+
+  def render(self, name, labels=""):
+    lines = []
+    total = 0
+
+    for bound, value in zip(self.bounds + ("+Inf", ), self.buckets):
+      total += value
+      lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {total}')
+
+    labels = f"{{{labels.rstrip(',')}}}" if labels else ""
+    lines.append(f"{name}_sum{labels} {self.sum}")
+    lines.append(f"{name}_count{labels} {total}")
+
+    return lines
+
+
+class SessionMetrics:
+  def __init__(self):
+    self.statement = "other"  # class of the statement being run, set by the session
+    self.latency = {}
+    self.rows = Histogram(ROWS)
+    self.bytes = Histogram(BYTES)
+    self.commands = [0] * 256
+
+  def observe(self, elapsed, sent):
+    if self.statement not in self.latency:
+      self.latency[self.statement] = Histogram(LATENCY)
+
+    self.latency[self.statement].observe(elapsed)
+    self.bytes.observe(sent)
+
+  def merge(self, other):
+    for statement, histogram in list(other.latency.items()):
+      self.latency.setdefault(statement, Histogram(LATENCY)).merge(histogram)
+
+    self.rows.merge(other.rows)
+    self.bytes.merge(other.bytes)
+
+    for command, value in enumerate(other.commands):
+      self.commands[command] += value
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+  def do_GET(self):
+    if self.path.split("?", 1)[0] != "/metrics":
+      self.send_error(404)
+      return
+
+    body = self.server.metrics.render().encode()
+    self.send_response(200)
+    self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    pass
+
+
+class Metrics:  # Prometheus text exposition, sessions fold their metrics in on close
+  def __init__(self, server):
+    self.server = server
+    self.lock = Lock()
+    self.totals = SessionMetrics()
+    self.sessions = {}
+    self.http = None
+
+  def connect(self, identifier):
+    metrics = SessionMetrics()
+
+    with self.lock:
+      self.sessions[identifier] = metrics
+
+    return metrics
+
+  def disconnect(self, identifier):
+    with self.lock:
+      metrics = self.sessions.pop(identifier, None)
+
+      if metrics is not None:
+        self.totals.merge(metrics)
+
+  def collect(self):
+    metrics = SessionMetrics()
+
+    with self.lock:
+      metrics.merge(self.totals)
+      for session in list(self.sessions.values()):  # copies, sessions keep writing
+        metrics.merge(session)
+
+    return metrics
+
+  def render(self):
+    metrics = self.collect()
+    lines = []
+
+    def add(name, kind, text, samples):
+      lines.append(f"# HELP {name} {text}")
+      lines.append(f"# TYPE {name} {kind}")
+      lines.extend(samples)
+
+    add("mysqlite_query_duration_seconds", "histogram", "Statement latency by statement class",
+        [line for statement, histogram in sorted(metrics.latency.items())
+         for line in histogram.render("mysqlite_query_duration_seconds", f'statement="{statement}",')])
+    add("mysqlite_result_rows", "histogram", "Rows per result set",
+        metrics.rows.render("mysqlite_result_rows"))
+    add("mysqlite_response_bytes", "histogram", "Bytes sent per statement",
+        metrics.bytes.render("mysqlite_response_bytes"))
+
+    names = {command.value: command.name.lower() for command in Command}
+    add("mysqlite_commands_total", "counter", "Protocol commands received",
+        [f'mysqlite_commands_total{{command="{names.get(command, "unknown")}"}} {value}'
+         for command, value in enumerate(metrics.commands) if value])
+
+    sessions = list(connections.values())
+    running = sum(1 for connection in sessions if connection["command"] != Command.SLEEP.value)
+    add("mysqlite_connections", "gauge", "Client connections by state",
+        [f'mysqlite_connections{{state="active"}} {running}',
+         f'mysqlite_connections{{state="idle"}} {len(sessions) - running}'])
+
+    values = self.server.counters.status()
+    values.update(self.server.admission.status())
+
+    for name, value in sorted(values.items()):
+      add(f"mysqlite_global_status_{name.lower()}", "untyped", f"Global status {name}",
+          [f"mysqlite_global_status_{name.lower()} {value}"])
+
+    sources = [("pool", self.server.pool), ("cache", self.server.cache),
+               ("compression", self.server.compression), ("schemas", self.server.schemas)]
+
+    for prefix, source in sources:
+      if source is not None:
+        for name, value in sorted(source.status().items()):
+          add(f"mysqlite_{prefix}_{name}", "gauge", f"{prefix.capitalize()} {name.replace('_', ' ')}",
+              [f"mysqlite_{prefix}_{name} {value}"])
+
+    return "\n".join(lines) + "\n"
+
+  def start(self, address, port):
+    self.http = ThreadingHTTPServer((address, port), MetricsHandler)
+    self.http.daemon_threads = True
+    self.http.metrics = self
+    Thread(target=self.http.serve_forever, name="Metrics", daemon=True).start()
+    info(f"METRICS ON {address}:{port}")
@@ -1,45 +1,215 @@
 #!/usr/bin/env python3
 
 from argparse import ArgumentDefaultsHelpFormatter, ArgumentParser
-from logging import DEBUG, INFO, basicConfig, info
-from os.path import isfile
+from asyncio import run
+from functools import partial
+from itertools import count
+from logging import INFO, basicConfig, info
+from os.path import isdir, isfile
 from socketserver import ThreadingTCPServer
 from sys import exit
 
 from mysqlite import __version__
+from mysqlite.admission import Admission
+from mysqlite.asyncserver import AsyncServer
+from mysqlite.cache import ResultCache
+from mysqlite.compression import Compression
+from mysqlite.counters import Counters
+from mysqlite.database import Pool, Settings
+from mysqlite.metrics import Metrics
+from mysqlite.prefork import Supervisor
+from mysqlite.schemas import Schemas
 from mysqlite.server import Server
+from mysqlite.slowlog import SlowLog
+from mysqlite.snapshot import Snapshot
+from mysqlite.tracing import trace
+from mysqlite.utils import file_signature
 
 
-def main():
+def build_parser():
   parser = ArgumentParser(prog="mysqlite", add_help=False, allow_abbrev=False, formatter_class=ArgumentDefaultsHelpFormatter)
   parser.add_argument("--filename", help="Filename of the SQLite database")
+  parser.add_argument("--datadir", help="Directory of SQLite databases (.db, .sqlite, .sqlite3), one schema per file")
+  parser.add_argument("--max-open-schemas", default=64, type=int, help="Schemas of --datadir kept open at once")
+  parser.add_argument("--schema-idle", default=300, type=int, help="Seconds unused before a schema is closed (0 = never)")
+  parser.add_argument("--in-memory", action="store_true", help="Serve a copy of --filename loaded into memory, loaded again when the file changes")
+  parser.add_argument("--immutable", action="store_true", help="Open the databases as immutable: no locking or change detection, they must not be written while served")
+  parser.add_argument("--mmap-size", default=0, type=int, help="Bytes of each database read through memory-mapped I/O (0 = SQLite default)")
+  parser.add_argument("--page-cache", default=0, type=int, help="Bytes of page cache per SQLite connection (0 = SQLite default)")
+  parser.add_argument("--temp-store", default="default", choices=["default", "file", "memory"], help="Where SQLite keeps temporary tables and indices")
+  parser.add_argument("--shared-cache", action="store_true", help="Share one page cache between the SQLite connections to the same file")
+  parser.add_argument("--pragma", action="append", default=[], metavar="NAME=VALUE", help="Extra PRAGMA for every SQLite connection, can be repeated")
   parser.add_argument("--address", default="localhost", help="IP address to bind to")
   parser.add_argument("--port", default=3306, type=int, help="Port number to use for connections")
+  parser.add_argument("--engine", default="threading", choices=["threading", "asyncio"], help="Thread per connection or event loop")
+  parser.add_argument("--workers", default=1, type=int, help="Number of pre-forked worker processes")
+  parser.add_argument("--threads", default=8, type=int, help="Query threads for the asyncio engine")
+  parser.add_argument("--pool-min", default=1, type=int, help="SQLite connections opened at startup")
+  parser.add_argument("--pool-max", default=0, type=int, help="Maximum SQLite connections (0 = no limit)")
+  parser.add_argument("--pool-idle", default=8, type=int, help="Idle SQLite connections kept open for reuse")
+  parser.add_argument("--pool-timeout", default=10, type=float, help="Seconds to wait for a free SQLite connection")
+  parser.add_argument("--pool-mode", default="session", choices=["session", "query"], help="Hold a SQLite connection per client session or per query")
+  parser.add_argument("--cache-size", default=0, type=int, help="Bytes of SELECT results to cache (0 = disabled)")
+  parser.add_argument("--cache-entry", default=1048576, type=int, help="Largest single result to cache, in bytes")
+  parser.add_argument("--max-prepared", default=256, type=int, help="Prepared statements allowed per connection")
+  parser.add_argument("--max-allowed-packet", default=64 * 1024 * 1024, type=int, help="Largest packet accepted or sent, in bytes")
+  parser.add_argument("--compress-level", default=6, type=int, help="zlib level for clients using compression (0 = not offered)")
+  parser.add_argument("--compress-min", default=50, type=int, help="Smallest payload worth compressing, in bytes")
+  parser.add_argument("--flush-bytes", default=65536, type=int, help="Send buffered rows once they reach this many bytes (0 = no limit)")
+  parser.add_argument("--flush-rows", default=0, type=int, help="Send buffered rows once they reach this many rows (0 = no limit)")
+  parser.add_argument("--max-connections", default=151, type=int, help="Client connections allowed at once, per worker (0 = no limit)")
+  parser.add_argument("--connect-wait", default=1.0, type=float, help="Seconds a connection over --max-connections waits for a free slot")
+  parser.add_argument("--back-log", default=128, type=int, help="Connections queued by the kernel before they are accepted")
+  parser.add_argument("--connect-timeout", default=10, type=int, help="Seconds to wait for the login packet (0 = no limit)")
+  parser.add_argument("--wait-timeout", default=28800, type=int, help="Seconds before an idle connection is closed (0 = no limit)")
+  parser.add_argument("--interactive-timeout", default=28800, type=int, help="Same as --wait-timeout, for interactive clients")
+  parser.add_argument("--max-execution-time", default=0, type=int, help="Interrupt SELECTs running longer than this, in milliseconds (0 = no limit)")
+  parser.add_argument("--long-query-time", default=10.0, type=float, help="Queries slower than this count as Slow_queries, in seconds")
+  parser.add_argument("--slow-log", help="Log queries slower than --long-query-time to this file (- = stderr)")
+  parser.add_argument("--metrics-port", default=0, type=int, help="Serve Prometheus metrics over HTTP on this port, plus the worker number (0 = disabled)")
   parser.add_argument("--debug", action="store_true", help="Print packets payload")
+  parser.add_argument("--quiet", action="store_true", help="Do not log queries")
+  parser.add_argument("--log-sample", default=1, type=int, help="Log only 1 in N queries (and their packets)")
   parser.add_argument("--version", action="store_true", help="Version information")
   parser.add_argument("--help", action="store_true", help="This help")
+  return parser
+
+
+def main():
+  parser = build_parser()
   args = parser.parse_args()
 
   if args.version:
     print(f"MySQLite {__version__}")
     exit()
-  elif args.help or args.filename is None or len(args.filename) == 0:
+  elif args.help or not (args.filename or args.datadir):
     parser.print_help()
     exit()
+  elif args.datadir:
+    if args.in_memory:
+      parser.error("--in-memory serves a single --filename")
+    if not isdir(args.datadir):
+      raise NotADirectoryError(args.datadir)
   elif not isfile(args.filename):
     raise FileNotFoundError(args.filename)
 
-  level = DEBUG if args.debug else INFO
-  basicConfig(format="%(threadName)s %(levelname).3s %(message)s", level=level)
+  prefix = "%(process)d " if args.workers > 1 else ""
+  basicConfig(format=prefix + "%(threadName)s %(levelname).3s %(message)s", level=INFO)
+  trace.configure(args.debug, not args.quiet, args.log_sample)
+  trace.install_signals()
+
+  info(f"MySQLite {__version__}")
+  info("STARTING...")
+  report(args)
+
+  serve = serve_asyncio if args.engine == "asyncio" else serve_threading
+
+  if args.workers > 1:
+    Supervisor(args.address, args.port, args.workers, args.back_log).run(partial(serve, args))
+  else:
+    serve(args)
+
+
+def settings(args):
+  pragmas = []
+
+  if args.mmap_size > 0:
+    pragmas.append(("mmap_size", args.mmap_size))
+  if args.page_cache > 0:
+    pragmas.append(("cache_size", args.page_cache // -1024))  # negative = KiB, rounded up
+  if args.temp_store != "default":
+    pragmas.append(("temp_store", args.temp_store.upper()))
+
+  for pragma in args.pragma:
+    name, _, value = pragma.partition("=")
+    pragmas.append((name.strip(), value.strip()))
+
+  return Settings(args.immutable, args.shared_cache, pragmas)
+
+
+def report(args):  # effective settings of a new connection, logged once at startup
+  filename = args.filename
 
+  if args.datadir:  # the first schema stands for all of them
+    schemas = Schemas(args.datadir, None)
+    names = schemas.names()
+    if not names:
+      return
+    filename = schemas.path(names[0])
+
+  values = settings(args).report(filename)
+  info("SQLITE " + " ".join(f"{name}={value}" for name, value in values.items()))
+
+
+def configure(server, args, identifiers=None, worker=0):
+  server.identifiers = count(1) if identifiers is None else identifiers
+  server.filename = args.filename
+  server.schemas = None
+
+  tuning = settings(args)
+
+  def pool(filename):
+    return Pool(filename, args.pool_min, args.pool_max, args.pool_idle,
+                args.pool_timeout, args.pool_mode == "query",
+                args.slow_log is not None, server.schemas, tuning)
+
+  server.snapshot = None
+
+  if args.datadir:  # sessions without a schema get an empty in-memory database
+    server.schemas = Schemas(args.datadir, pool, args.max_open_schemas, args.schema_idle)
+    server.schemas.start()
+    server.pool = pool(":memory:")
+  elif args.in_memory:  # served from a copy, reloaded in the background when the file changes
+    server.snapshot = Snapshot(args.filename)
+    server.pool = pool(server.snapshot.load())
+    server.snapshot.start(server.pool)
+  else:
+    server.pool = pool(args.filename)
+
+  def version(schema):  # of the data the cached results of a schema depend on
+    if server.snapshot is not None:
+      return server.snapshot.generation
+    if server.schemas is not None:
+      return file_signature(server.schemas.path(schema) or ":memory:")
+    return file_signature(args.filename)
+
+  server.cache = None
+  if args.cache_size > 0:
+    server.cache = ResultCache(version, args.cache_size, args.cache_entry)
+  server.flush_bytes = args.flush_bytes
+  server.max_prepared = args.max_prepared
+  server.max_allowed_packet = args.max_allowed_packet
+  server.compression = None
+  if args.compress_level > 0:
+    server.compression = Compression(args.compress_level, args.compress_min)
+  server.flush_rows = args.flush_rows
+  server.counters = Counters()
+  server.max_execution_time = args.max_execution_time
+  server.admission = Admission(args.max_connections, args.connect_wait, args.connect_timeout,
+                               args.wait_timeout, args.interactive_timeout)
+  server.admission.start()
+  server.long_query_time = args.long_query_time
+  server.slow_log = None
+  if args.slow_log is not None:
+    server.slow_log = SlowLog(args.slow_log)
+  server.metrics = None
+  if args.metrics_port > 0:
+    server.metrics = Metrics(server)
+    server.metrics.start(args.address, args.metrics_port + worker)
+
+
+def serve_threading(args, sock=None, identifiers=None, worker=0):
   with ThreadingTCPServer((args.address, args.port), Server, False) as server:
     try:
-      info(f"MySQLite {__version__}")
-      info("STARTING...")
-      server.allow_reuse_address = True
-      server.server_bind()
-      server.server_activate()
-      server.filename = args.filename
+      if sock is None:
+        server.allow_reuse_address = True
+        server.request_queue_size = args.back_log
+        server.server_bind()
+        server.server_activate()
+      else:  # pre-forked worker, listening socket inherited from supervisor
+        server.socket.close()
+        server.socket = sock
+      configure(server, args, identifiers, worker)
 
       server.serve_forever()
     except KeyboardInterrupt:
@@ -47,5 +217,17 @@ def main():
       server.shutdown()
 
 
+def serve_asyncio(args, sock=None, identifiers=None, worker=0):
+  server = AsyncServer(args.address, args.port, args.threads, sock)
+  server.back_log = args.back_log
+  configure(server, args, identifiers, worker)
+
+  try:
+    run(server.serve_forever())
+  except KeyboardInterrupt:
+    info("STOPPING...")
+    server.shutdown()
+
+
 if __name__ == "__main__":
   main()
@@ -1,6 +1,9 @@
-from re import IGNORECASE, MULTILINE, match
+from collections import namedtuple
+from re import IGNORECASE, MULTILINE, compile
 
 
+QUOTED = compile(r"('(?:[^']|'')*'|\"[^\"]*\"|`[^`]*`)")
+
 STATEMENTS = {
   "show_character_set": r"^SHOW\s+CHARACTER\s+SET(?:\s+LIKE\s+'(?P<pattern>[^']+)')?$",
   "show_collation": r"^SHOW\s+COLLATION(?:\s+LIKE\s+'(?P<pattern>[^']+)')?$",
@@ -13,19 +16,76 @@ STATEMENTS = {
   "show_processlist": r"^SHOW(?:\s+(?P<modifier>FULL))?\s+PROCESSLIST$",
   "show_table_status": r"^SHOW\s+TABLE\s+STATUS(?:\s+FROM\s+(?P<database>\w+|`[^`]+`))?(?:\s+LIKE\s+'(?P<pattern>[^']+)')?$",
   "show_tables": r"^SHOW\s+TABLES(?:\s+FROM\s+(?P<database>\w+|`[^`]+`))?(?:\s+LIKE\s+'(?P<pattern>[^']+)')?$",
-  "show_status": r"^SHOW\s+STATUS(?:\s+LIKE\s+'(?P<pattern>[^']+)')?$",
+  "show_status": r"^SHOW(?:\s+(?P<modifier>GLOBAL|SESSION))?\s+STATUS(?:\s+LIKE\s+'(?P<pattern>[^']+)')?$",
   "show_variables": r"^SHOW(?:\s+(?P<modifier>GLOBAL|SESSION))?\s+VARIABLES(?:\s+LIKE\s+'(?P<pattern>[^']+)')?$",
   # describe
   # explain
   "help": r"^HELP\s+'(?P<search>[^']+)'$",
   "use": r"^USE\s+(?P<database>\w+|`[^`]+`)$",
+  "kill": r"^KILL(?:\s+(?P<modifier>QUERY|CONNECTION))?\s+(?P<id>\d+)$",
+  "set_variable": r"^SET\s+(?:@@)?(?:(?P<modifier>GLOBAL|SESSION)(?:\s+|\.))?(?P<name>MAX_EXECUTION_TIME|WAIT_TIMEOUT|INTERACTIVE_TIMEOUT)\s*:?=\s*(?P<value>\d+)$",
 }
 
 
-def guess_statement(query):
-  for function, pattern in STATEMENTS.items():
-    results = match(pattern, query, IGNORECASE | MULTILINE)
-    if results:
-      return function, results.groupdict()
+PATTERNS = {function: compile(pattern, IGNORECASE | MULTILINE) for function, pattern in STATEMENTS.items()}
+
+WORD = compile(r"\s*(\w+)")
+MODIFIERS = {"FULL", "GLOBAL", "SESSION", "STORAGE"}
+
+KEYWORDS = {  # first keyword -> candidate statements, SHOW is routed by the word after it
+  "HELP": ("help", ),
+  "KILL": ("kill", ),
+  "SET": ("set_variable", ),
+  "USE": ("use", ),
+}
+
+SHOW_KEYWORDS = {  # keyword after SHOW and its optional modifier
+  "CHARACTER": ("show_character_set", ),
+  "COLLATION": ("show_collation", ),
+  "COLUMNS": ("show_columns", ),
+  "CREATE": ("show_create_database", "show_create_table"),
+  "DATABASES": ("show_databases", ),
+  "ENGINES": ("show_engines", ),
+  "INDEX": ("show_index", ),
+  "PROCESSLIST": ("show_processlist", ),
+  "STATUS": ("show_status", ),
+  "TABLE": ("show_table_status", ),
+  "TABLES": ("show_tables", ),
+  "VARIABLES": ("show_variables", ),
+}
+
+Query = namedtuple("Query", ("keyword", "function", "params"))
+
+
+def _word(query, position=0):
+  word = WORD.match(query, position)
+  return (word.group(1).upper(), word.end()) if word else (None, position)
+
+
+def classify(query):  # SELECT and other unknown keywords cost a single regex match
+  word = WORD.match(query)
+
+  if word is None:
+    return Query(None, None, None)
+
+  keyword = word.group(1).upper()
+
+  if keyword == "SHOW":
+    second, position = _word(query, word.end())
+    if second in MODIFIERS:
+      second, position = _word(query, position)
+    candidates = SHOW_KEYWORDS.get(second, ())
   else:
-    return None, None
+    candidates = KEYWORDS.get(keyword, ())
+
+  for function in candidates:
+    results = PATTERNS[function].match(query)
+    if results:
+      return Query(keyword, function, results.groupdict())
+
+  return Query(keyword, None, None)
+
+
+def count_placeholders(query):
+  parts = QUOTED.split(query)
+  return sum(part.count("?") for part in parts[::2])  # odd parts are quoted
@@ -0,0 +1,99 @@
+from logging import info, warning
+from multiprocessing import Value
+from os import _exit, fork, kill, wait, waitpid
+from signal import SIGTERM, default_int_handler, signal
+from socket import create_server
+from time import monotonic, sleep
+from traceback import print_exc
+
+
+class SharedCounter:  # connection ids unique across all worker processes
+  def __init__(self):
+    self.value = Value("Q", 0)
+
+  def __iter__(self):
+    return self
+
+  def __next__(self):
+    with self.value.get_lock():
+      self.value.value += 1
+      return self.value.value
+
+
+class Supervisor:
+  restart_delay = 1.0
+
+  def __init__(self, address, port, workers, backlog=128):
+    self.address = address
+    self.port = port
+    self.workers = workers
+    self.backlog = backlog
+    self.children = {}
+    self.started = {}
+    self.stopping = False
+
+  def spawn(self, index, serve, sock, identifiers):
+    pid = fork()
+
+    if pid == 0:
+      code = 0
+      signal(SIGTERM, default_int_handler)
+
+      try:
+        serve(sock, identifiers, index)
+      except KeyboardInterrupt:
+        pass
+      except BaseException:
+        print_exc()
+        code = 1
+      finally:
+        _exit(code)
+
+    info(f"WORKER {index} STARTED (pid {pid})")
+    self.children[pid] = index
+    self.started[index] = monotonic()
+
+  def run(self, serve):
+    sock = create_server((self.address, self.port), backlog=self.backlog)
+    identifiers = SharedCounter()
+    signal(SIGTERM, default_int_handler)  # stopped like Ctrl-C, the workers are not left behind
+
+    for index in range(self.workers):
+      self.spawn(index, serve, sock, identifiers)
+
+    try:
+      while self.children:
+        pid, status = wait()
+        index = self.children.pop(pid, None)
+
+        if index is None or self.stopping:
+          continue
+
+        warning(f"WORKER {index} EXITED (status {status}), RESTARTING...")
+
+        if monotonic() - self.started[index] < self.restart_delay:
+          sleep(self.restart_delay)  # do not spin on a worker failing at startup
+
+        self.spawn(index, serve, sock, identifiers)
+    except KeyboardInterrupt:
+      info("STOPPING...")
+      self.stop()
+    finally:
+      sock.close()
+
+  def stop(self):
+    self.stopping = True
+
+    for pid in self.children:
+      try:
+        kill(pid, SIGTERM)
+      except ProcessLookupError:
+        pass
+
+    for pid in list(self.children):
+      try:
+        waitpid(pid, 0)
+      except ChildProcessError:
+        pass
+
+    self.children.clear()
@@ -0,0 +1,75 @@
+from struct import unpack_from
+
+from mysqlite.utils import MAX_PACKET, PacketTooLarge, Payload
+
+
+class PacketReader:  # packets straight from the socket into one reused buffer
+  def __init__(self, sock, size=65536):
+    self.sock = sock
+    self.buffer = bytearray(size)
+    self.view = memoryview(self.buffer)
+    self.start = self.end = 0  # unread bytes are buffer[start:end]
+
+  def _receive(self, needed):
+    if self.start + needed > len(self.buffer):  # move the unread tail to the front
+      pending = self.end - self.start
+      self.buffer[:pending] = self.view[self.start:self.end]
+      self.start, self.end = 0, pending
+
+    while self.end - self.start < needed:
+      received = self.sock.recv_into(self.view[self.end:])
+
+      if received == 0:
+        raise ConnectionResetError("Connection closed by client")
+
+      self.end += received
+
+  def read(self, size):  # a copy, for payloads bigger than the buffer and wrapping readers
+    data = bytearray(size)
+    view = memoryview(data)
+    filled = min(self.end - self.start, size)
+    view[:filled] = self.view[self.start:self.start + filled]
+    self.start += filled
+
+    while filled < size:
+      received = self.sock.recv_into(view[filled:])
+
+      if received == 0:
+        raise ConnectionResetError("Connection closed by client")
+
+      filled += received
+
+    return data
+
+  def _header(self):
+    self._receive(4)
+    header = unpack_from("<I", self.buffer, self.start)[0]
+    self.start += 4
+    return header & 0xffffff, header >> 24
+
+  def packet(self, limit):  # payload, sequence number and bytes on the wire
+    length, number = self._header()
+
+    if length > limit:
+      raise PacketTooLarge()
+
+    if length < MAX_PACKET and length <= len(self.buffer):  # valid until the next packet
+      self._receive(length)
+      payload = Payload(self.buffer, self.view, self.start, self.start + length)
+      self.start += length
+      return payload, number, length + 4
+
+    chunks = [self.read(length)]
+    total = length
+
+    while length == MAX_PACKET:  # payloads of 16M or more come in several packets
+      length, number = self._header()
+      total += length
+
+      if total > limit:
+        raise PacketTooLarge()
+
+      chunks.append(self.read(length))
+
+    data = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+    return Payload(data), number, total + 4 * len(chunks)
@@ -0,0 +1,103 @@
+from collections import OrderedDict
+from os import listdir, stat
+from os.path import join, splitext
+from re import compile
+from threading import Lock, Thread
+from time import monotonic, sleep
+
+
+EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+RESERVED = {"main", "temp"}  # names SQLite keeps for itself, never attached
+REFERENCE = compile(r"(?:`([^`]+)`|(\w+))\s*\.")  # schema.table, quoted or not
+
+
+class Schemas:  # every SQLite file of a directory is a schema, pools are opened on first use
+  interval = 1.0  # seconds between sweeps for idle pools
+
+  def __init__(self, directory, factory, maximum=64, idle=300):
+    self.directory = directory
+    self.factory = factory  # filename -> Pool
+    self.maximum = maximum  # open pools, the least recently used idle ones are closed first
+    self.idle = idle  # seconds unused before a pool is closed, 0 = never
+    self.files = {}
+    self.scanned = None
+    self.pools = OrderedDict()  # name -> [pool, last use]
+    self.lock = Lock()
+    self.stats = {"opened": 0, "closed": 0}
+
+  def _scan(self):  # called with the lock held, lists the directory again when it changes
+    version = stat(self.directory).st_mtime_ns
+
+    if version != self.scanned:
+      self.scanned = version
+      self.files = {}
+
+      for name in listdir(self.directory):
+        stem, extension = splitext(name)
+        if extension.lower() in EXTENSIONS:
+          self.files[stem] = join(self.directory, name)
+
+  def names(self):
+    with self.lock:
+      self._scan()
+      return sorted(self.files)
+
+  def path(self, name):
+    with self.lock:
+      self._scan()
+      return self.files.get(name)
+
+  def referenced(self, query):  # schemas whose tables the query names
+    with self.lock:
+      self._scan()
+      files = self.files
+
+    names = {quoted or plain for quoted, plain in REFERENCE.findall(query)}
+    return {name: files[name] for name in names if name in files and name not in RESERVED}
+
+  def _close(self, name):  # called with the lock held
+    pool = self.pools.pop(name)[0]
+    pool.close()
+    self.stats["closed"] += 1
+
+  def pool(self, name):
+    with self.lock:
+      entry = self.pools.get(name)
+
+      if entry is None:
+        self._scan()
+        entry = self.pools[name] = [self.factory(self.files[name]), 0]
+        self.stats["opened"] += 1
+
+        for other in [other for other, (pool, _) in self.pools.items() if not pool.busy()]:
+          if len(self.pools) <= self.maximum:
+            break
+          if other != name:
+            self._close(other)
+
+      self.pools.move_to_end(name)
+      entry[1] = monotonic()
+      return entry[0]
+
+  def sweep(self):
+    if not self.idle:
+      return
+
+    with self.lock:
+      expired = monotonic() - self.idle
+
+      for name in [name for name, (pool, used) in self.pools.items()
+                   if used < expired and not pool.busy()]:
+        self._close(name)
+
+  def _sweep(self):
+    while True:
+      sleep(self.interval)
+      self.sweep()
+
+  def start(self):
+    Thread(target=self._sweep, name="Schemas", daemon=True).start()
+
+  def status(self):
+    with self.lock:
+      return dict(self.stats, open=len(self.pools))
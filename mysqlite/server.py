@@ -1,23 +1,35 @@
 from io import BytesIO
+from itertools import chain
 from logging import debug, info
+from socket import SHUT_RD
 from socketserver import StreamRequestHandler
-from threading import current_thread
 from time import monotonic
 from traceback import print_exc
 
-from mysqlite.database import Database
+from apsw import InterruptError
+
+from mysqlite.compression import CompressedReader, CompressionError
+from mysqlite.counters import PROTOCOL, QUESTIONS, command_counter, \
+  statement_class
+from mysqlite.database import PoolTimeout
 from mysqlite.definitions import Capability, Charset, Command, FieldFlag, \
   FieldType, Status
-from mysqlite.parser import guess_statement
-from mysqlite.utils import pack_byte, pack_fixedstring, pack_header, \
-  pack_integer, pack_long, pack_nullstring, pack_padding, pack_resstring, \
-  pack_string, pack_varinteger, read_data, read_header, read_string, \
-  read_varstring
+from mysqlite.parser import classify, count_placeholders
+from mysqlite.reader import PacketReader
+from mysqlite.slowlog import QueryTimer
+from mysqlite.statement import Statement
+from mysqlite.tracing import trace
+from mysqlite.utils import MAX_PACKET, PacketTooLarge, Payload, WrongValue, \
+  binary_converters, binary_meta, column_converters, pack_binary_rows, \
+  pack_byte, pack_fixedstring, pack_header, pack_integer, pack_long, \
+  pack_nullstring, pack_padding, pack_rows, pack_string, pack_varinteger, \
+  read_data, read_header, read_string, read_varstring
 
 
 CAPABILITIES = Capability.LONG_PASSWORD | Capability.FOUND_ROWS | \
   Capability.LONG_FLAG | Capability.CONNECT_WITH_DB | Capability.NO_SCHEMA | \
-  Capability.PROTOCOL_41 | Capability.SECURE_CONNECTION
+  Capability.PROTOCOL_41 | Capability.INTERACTIVE | Capability.TRANSACTIONS | \
+  Capability.SECURE_CONNECTION | Capability.DEPRECATE_EOF
 CHARSET = Charset.UTF8_GENERAL_CI
 STATUS = Status.AUTOCOMMIT
 
@@ -25,57 +37,149 @@ STATUS = Status.AUTOCOMMIT
 connections = {}
 
 
-class Server(StreamRequestHandler):
+class Session:
   thread = 0
+  pool = None
   db = None
   number = -1
   connected = False
   packet = None
   port = 0
+  traced = True
+  capture = None
+  captured = 0
+  binary = False
+  deprecate_eof = False
+  compressed = False
+  compressed_number = 0
+  statements = None
+  statement_id = 0
+  counters = None
+  quitting = False
+  timer = None
+  metrics = None
+  max_execution_time = 0  # milliseconds, SELECTs only as in MySQL
+  wait_timeout = 0  # seconds idle before the session is closed, 0 = never
+  killed = False
+  admitted = False
 
   capabilities = 0
   max_packet = 0
+  packet_limit = 0
   charset = 0
   attributes = {}
   username = ""
   schema = ""
 
-  def queue_packet(self, payload, send=False):
-    if type(payload) is BytesIO:
-      payload = payload.getvalue()
-
+  def next_number(self):
     if self.number < 255:
       self.number += 1
     else:
       self.number = 0
 
+    return self.number
+
+  def queue_packet(self, payload, send=False):
+    if type(payload) is BytesIO:
+      payload = payload.getvalue()
+
     length = len(payload)
-    header = pack_header(length, self.number)
-    debug(f"> {payload}")
 
-    self.packet.write(header)
-    self.packet.write(payload)
+    if length > self.packet_limit:
+      raise PacketTooLarge()
+
+    if self.traced and trace.packets:
+      debug("> %r", payload)
+
+    if length < min(self.server.flush_bytes or MAX_PACKET, MAX_PACKET):  # larger ones need splitting
+      self.packet.write(pack_header(length, self.next_number()))
+      self.packet.write(payload)
+    else:
+      self.send_large(payload)
+
+    if self.capture is not None:
+      self.captured += length
+
+      if self.captured <= self.server.cache.entry:
+        self.capture.append(payload)
+      else:  # too big for the result cache, stop collecting
+        self.capture = None
+        self.server.cache.abandon()
 
     if send:
       self.send_packets()
 
+  def send_large(self, payload):  # split in 16M packets, written without copying
+    self.send_packets()
+    view = memoryview(payload)
+    offset = 0
+
+    while True:
+      chunk = view[offset:offset + MAX_PACKET]
+      header = pack_header(len(chunk), self.next_number())
+
+      if self.compressed:
+        self.packet.write(header)
+        self.packet.write(chunk)
+        self.send_packets()
+      else:
+        self.write_data(header)
+        self.write_data(chunk)
+
+      if len(chunk) < MAX_PACKET:  # a full last chunk is followed by an empty one
+        break
+
+      offset += MAX_PACKET
+
+  def write_data(self, data):
+    if self.timer is None:
+      self.wfile.write(data)
+    else:
+      started = monotonic()
+      self.wfile.write(data)
+      self.timer.write += monotonic() - started
+
+    self.counters["Bytes_sent"] += len(data)
+
   def send_packets(self):
-    self.wfile.write(self.packet.getvalue())
+    if self.compressed:
+      data, self.compressed_number = \
+        self.server.compression.pack(self.packet.getvalue(), self.compressed_number)
+      self.write_data(data)
+    else:
+      self.write_data(self.packet.getvalue())
     self.packet.seek(0)
     self.packet.truncate(0)
 
+  def inflate(self, payload, number, original):
+    self.compressed_number = number
+    return self.server.compression.unpack(payload, original)
+
+  def start_compression(self):
+    self.compressed = True
+
+  def server_capabilities(self):
+    capabilities = CAPABILITIES
+
+    if self.server.compression is not None:
+      capabilities |= Capability.COMPRESS
+
+    return capabilities
+
   def send_handshake(self):
+    capabilities = self.server_capabilities()
+
     payload = BytesIO()
     payload.write(pack_byte(10))  # protocol version
     payload.write(pack_nullstring(self.db.version))  # server version
     payload.write(pack_long(self.thread))  # connection id
     payload.write(pack_fixedstring(" " * 8))  # auth-plugin-data-part-1
     payload.write(pack_padding())  # filler
-    payload.write(pack_integer(CAPABILITIES))  # capability flags
+    payload.write(pack_integer(capabilities & 0xffff))  # capability flags
 
     payload.write(pack_byte(CHARSET))  # character set
     payload.write(pack_integer(STATUS))  # status flags
-    payload.write(pack_integer(CAPABILITIES >> 16))  # capability flags
+    payload.write(pack_integer(capabilities >> 16))  # capability flags
 
     payload.write(pack_padding())
 
@@ -88,10 +192,10 @@ class Server(StreamRequestHandler):
 
     self.queue_packet(payload, True)
 
-  def send_ok(self, affected_rows=0, last_insert_id=0, warnings=0):
+  def send_ok(self, affected_rows=0, last_insert_id=0, warnings=0, header=0x00, send=True):
     payload = BytesIO()
 
-    payload.write(pack_padding())  # header
+    payload.write(pack_byte(header))  # header, 0xfe when it ends a result set
     payload.write(pack_varinteger(affected_rows))  # affected_rows
     payload.write(pack_varinteger(last_insert_id))  # last_insert_id
 
@@ -99,9 +203,14 @@ class Server(StreamRequestHandler):
       payload.write(pack_integer(STATUS))  # status_flags
       payload.write(pack_integer(warnings))  # warnings
 
-    self.queue_packet(payload, True)
+    self.queue_packet(payload, send)
+
+  def send_eof(self, warnings=0, last=False):
+    if self.deprecate_eof:  # only the one ending the rows is left, as an OK
+      if last:
+        self.send_ok(warnings=warnings, header=0xfe, send=False)
+      return
 
-  def send_eof(self, warnings=0):
     payload = BytesIO()
     payload.write(pack_byte(0xfe))  # header
     payload.write(pack_integer(warnings))  # warnings
@@ -122,10 +231,26 @@ class Server(StreamRequestHandler):
 
     self.queue_packet(payload, True)
 
+  def send_exception(self, error):
+    if isinstance(error, PacketTooLarge):
+      self.send_error(str(error), 1153, "08S01")
+    elif isinstance(error, CompressionError):
+      self.send_error(str(error), 1157, "08S01")
+    elif isinstance(error, InterruptError):
+      if self.db.timed_out():
+        self.send_error("Query execution was interrupted, maximum statement execution time exceeded", 3024, "HY000")
+      else:
+        self.send_error("Query execution was interrupted", 1317, "70100")
+    elif isinstance(error, WrongValue):
+      self.send_error(str(error), 1292, "22007")
+    else:
+      print_exc()
+      self.send_error(str(error))
+
   def send_unsupported(self, command):
     self.send_error(f"This version of SQLite doesn't yet support '{command}'", 1235)
 
-  def send_columndef(self, name, _type, length, decimals):
+  def columndef(self, name, _type, length, decimals):
     payload = BytesIO()
 
     collation = Charset.UTF8_GENERAL_CI if _type == FieldType.VAR_STRING else Charset.BINARY
@@ -157,27 +282,66 @@ class Server(StreamRequestHandler):
     payload.write(pack_byte(decimals))  # decimals
     payload.write(pack_padding(2))  # filler
 
-    self.queue_packet(payload)
+    return payload.getvalue()
+
+  def send_columndef(self, name, _type, length, decimals):
+    self.queue_packet(self.columndef(name, _type, length, decimals))
+
+  def columndefs(self, meta):  # built before anything is queued, a column too large fails alone
+    columns = [self.columndef(name, _type, length, decimals)
+               for (name, _, _type, length, decimals) in meta]
+
+    if any(len(column) > self.packet_limit for column in columns):
+      raise PacketTooLarge()
+
+    return columns
 
   def send_resultset(self, data):
     meta, rows = data
+
+    if self.binary:  # column types have to be settled before the first row is sent
+      rows = iter(rows)
+      first = next(rows, None)
+      meta = binary_meta(meta, first)
+
+      if first is not None:
+        rows = chain((first, ), rows)
+
+    columns = self.columndefs(meta)
     self.queue_packet(pack_byte(len(meta)))
 
-    for (name, _, _type, length, decimals) in meta:
-      self.send_columndef(name, _type, length, decimals)
+    for column in columns:
+      self.queue_packet(column)
 
     self.send_eof()
 
-    for row in rows:
-      payload = BytesIO()
+    flush_bytes = self.server.flush_bytes
+    flush_rows = self.server.flush_rows
+    pending = 0
 
-      for value in row:
-        payload.write(pack_resstring(value))
+    if self.binary:
+      packets = pack_binary_rows(rows, binary_converters(meta))
+    else:
+      packets = pack_rows(rows, column_converters(meta))
+
+    sent = 0
 
+    for payload in packets:
       self.queue_packet(payload)
+      pending += 1
+      sent += 1
 
-    self.send_eof()
+      if (flush_bytes and self.packet.tell() >= flush_bytes) or \
+         (flush_rows and pending >= flush_rows):
+        self.send_packets()
+        pending = 0
+
+    self.send_eof(last=True)
     self.send_packets()
+    self.counters["Rows_sent"] += sent
+
+    if self.metrics is not None:
+      self.metrics.rows.observe(sent)
 
   def send_processlist(self, full):
     meta = (("Id", "INTEGER"), ("User", "VARCHAR(16)"),
@@ -204,6 +368,11 @@ class Server(StreamRequestHandler):
   def handle_handshake(self, payload):
     self.capabilities, self.max_packet, self.charset = \
       read_data(payload, "<IIb23x")
+
+    if self.max_packet:
+      self.packet_limit = min(self.max_packet, self.server.max_allowed_packet)
+    self.capabilities &= self.server_capabilities()  # what was not advertised is not honored
+    self.deprecate_eof = bool(self.capabilities & Capability.DEPRECATE_EOF)
     self.username = read_string(payload)
 
     if self.capabilities & Capability.SECURE_CONNECTION:
@@ -211,6 +380,7 @@ class Server(StreamRequestHandler):
     else:
       read_string(payload)
 
+    self.wait_timeout = self.server.admission.timeout(self.capabilities & Capability.INTERACTIVE)
     database = ""
 
     if self.capabilities & Capability.CONNECT_WITH_DB:
@@ -221,8 +391,31 @@ class Server(StreamRequestHandler):
 
     self.connected = True
 
+    if self.capabilities & Capability.COMPRESS:  # the reply above is still plain
+      self.start_compression()
+
+  def schema_pool(self):  # pool of the current schema, or the only one there is
+    if self.server.schemas is None or not self.schema:
+      return self.server.pool
+    return self.server.schemas.pool(self.schema)
+
+  def crosses_schemas(self, query):  # results depending on other files are not cached
+    schemas = self.server.schemas
+    return schemas is not None and bool(schemas.referenced(query).keys() - {self.schema})
+
   def use_database(self, name):
     if name in self.db.get_databases():
+      if self.server.schemas is not None and name != self.schema:
+        pool = self.server.schemas.pool(name)
+
+        try:
+          db = pool.acquire()
+        except PoolTimeout as e:
+          self.send_error(str(e), 1040, "08004")
+          return
+
+        self.give_back(pool, db)
+
       self.send_ok()
       self.schema = name
       connections[self.port]["schema"] = self.schema
@@ -233,8 +426,252 @@ class Server(StreamRequestHandler):
   def _extract_table(self, text):
     return text.replace("`", "").split(".")[-1]
 
-  def process_query(self, text):
-    function, params = guess_statement(text)
+  def status(self, scope=None):
+    session = scope is None or scope.upper() == "SESSION"
+    values = self.server.counters.status(self.counters if session else None)
+    running = [connection for connection in list(connections.values())
+               if connection["command"] != Command.SLEEP.value]
+    values["Threads_connected"] = len(connections)
+    values["Threads_running"] = len(running)
+    values.update(self.server.admission.status())
+
+    for name, value in self.pool.status().items():
+      values[f"Pool_{name}"] = value
+
+    if self.server.schemas is not None:
+      for name, value in self.server.schemas.status().items():
+        values[f"Schemas_{name}"] = value
+
+    if self.server.cache is not None:
+      for name, value in self.server.cache.status().items():
+        values[f"Qcache_{name}"] = value
+
+    if self.server.compression is not None:
+      for name, value in self.server.compression.status().items():
+        values[f"Compression_{name}"] = value
+
+    return values
+
+  def execute(self, query, params=None):
+    if self.max_execution_time:
+      self.db.limit(self.max_execution_time / 1000)
+
+    if self.timer is None:
+      return self.db.execute(query, params)
+
+    started = monotonic()
+    meta, rows = self.db.execute(query, params)
+    self.timer.execute += monotonic() - started
+
+    return meta, self.timer.rows(rows)
+
+  def select(self, query):
+    cache = self.server.cache
+    key = None
+
+    if cache is not None and not self.crosses_schemas(query):
+      key = cache.key(self.schema, self.capabilities, query)
+
+    if key is not None:
+      packets, version = cache.get(key)
+
+      if packets is not None:
+        if self.timer is not None:
+          self.timer.cache_hit = True
+
+        for payload in packets:
+          self.queue_packet(payload)
+        self.send_packets()
+        rows = len(packets) - packets[0][0] - (2 if self.deprecate_eof else 3)  # count, columns, eofs
+        self.counters["Rows_sent"] += rows
+
+        if self.metrics is not None:
+          self.metrics.rows.observe(rows)
+        return
+
+      self.capture = []
+      self.captured = 0
+
+    try:
+      self.send_resultset(self.execute(query))
+    except Exception as e:
+      self.capture = None
+      self.send_exception(e)
+
+    if self.capture is not None:
+      cache.put(key, self.capture, version)
+      self.capture = None
+
+  def run_query(self, query):
+    statement = classify(query)
+    counter = command_counter(statement)
+
+    if self.timer is not None:
+      self.timer.lap()
+
+    if counter is not None:
+      self.counters[counter] += 1
+    if self.metrics is not None:
+      self.metrics.statement = statement_class(statement)
+
+    if statement.keyword == "SELECT":
+      self.select(query)
+      return
+
+    try:
+      processed = self.process_query(statement)
+    except Exception as e:  # answered with an error, the connection stays open
+      self.send_exception(e)
+      return
+
+    if not processed:
+      if statement.keyword == "SET":
+        self.send_ok()
+      else:
+        message = f"Access denied for user '{self.username}'@'{self.client_address[0]}' to database '{self.schema}'"
+        self.send_error(message, 1044)
+
+  def give_back(self, pool=None, db=None):  # returns the connection, replaced by db from pool if given
+    with self.pool.condition:  # held while self.db changes, so interrupt() never reaches a lent connection
+      self.pool.release(self.db)
+      self.pool, self.db = pool or self.pool, db
+
+  def interrupt(self, connection=False):  # called from the thread of another session
+    if connection:
+      self.killed = True
+
+    while True:
+      pool = self.pool
+
+      with pool.condition:  # the connection cannot be given back meanwhile, see give_back()
+        if pool is not self.pool:  # moved to another schema, look again
+          continue
+
+        db = self.db
+
+        if db is not None and connections.get(self.port, {}).get("command") != Command.SLEEP.value:
+          db.interrupt()
+
+      break
+
+    if connection:  # wakes up a session waiting for its next command
+      try:
+        self.request.shutdown(SHUT_RD)
+      except OSError:
+        pass
+
+  def kill(self, identifier, connection=True):
+    for target in list(connections.values()):
+      if target["thread"] == identifier:
+        target["session"].interrupt(connection)
+        self.send_ok()
+        return
+
+    self.send_error(f"Unknown thread id: {identifier}", 1094, "HY000")
+
+  def set_variable(self, modifier, name, value):
+    name = name.lower()
+
+    if modifier is not None and modifier.upper() == "GLOBAL":  # sessions opened from now on
+      target = self.server if name == "max_execution_time" else self.server.admission
+    else:
+      target = self
+
+    setattr(target, name, value)
+    self.send_ok()
+
+  def send_unknown_statement(self, identifier, function):
+    self.send_error(f"Unknown prepared statement handler ({identifier}) given to {function}", 1243, "HY000")
+
+  def prepare_statement(self, query):
+    if self.traced and trace.queries:
+      info("PREPARE: %s", query)
+    if self.timer is not None:
+      self.timer.query = query
+
+    if len(self.statements) >= self.server.max_prepared:
+      self.send_error(f"Can't create more than max_prepared_stmt_count statements (current value: {self.server.max_prepared})", 1461, "42000")
+      return
+
+    params = count_placeholders(query)
+    select = classify(query).keyword == "SELECT"
+
+    if not select and params:
+      self.send_error("This command is not supported in the prepared statement protocol yet", 1295, "HY000")
+      return
+
+    try:
+      meta = self.db.prepare(query, params) if select else []
+    except Exception as e:
+      self.send_error(str(e))
+      return
+
+    try:
+      columns = self.columndefs(meta)
+    except PacketTooLarge as e:
+      self.send_exception(e)
+      return
+
+    self.statement_id += 1
+    statement = Statement(self.statement_id, query, params, meta, select)
+    self.statements[statement.id] = statement
+
+    payload = BytesIO()
+    payload.write(pack_padding())  # status
+    payload.write(pack_long(statement.id))  # statement_id
+    payload.write(pack_integer(len(meta)))  # num_columns
+    payload.write(pack_integer(params))  # num_params
+    payload.write(pack_padding())  # reserved
+    payload.write(pack_integer(0))  # warning_count
+    self.queue_packet(payload)
+
+    if params:
+      for _ in range(params):
+        self.send_columndef("?", FieldType.VAR_STRING, 0, 0)
+      self.send_eof()
+
+    if columns:
+      for column in columns:
+        self.queue_packet(column)
+      self.send_eof()
+
+    self.send_packets()
+
+  def execute_statement(self, payload):
+    identifier = read_data(payload, "<I")[0]
+    statement = self.statements.get(identifier)
+
+    if statement is None:
+      self.send_unknown_statement(identifier, "mysqld_stmt_execute")
+      return
+
+    if self.traced and trace.queries:
+      info("EXECUTE: %s", statement.query)
+    if self.timer is not None:
+      self.timer.query = statement.query
+
+    self.binary = True
+
+    try:
+      params = statement.read_params(payload)
+
+      if self.timer is not None:
+        self.timer.lap()
+
+      if statement.select:
+        self.counters["Com_select"] += 1
+        if self.metrics is not None:
+          self.metrics.statement = "select"
+        self.send_resultset(self.execute(statement.query, params))
+      else:
+        self.run_query(statement.query)
+    except Exception as e:
+      self.send_exception(e)
+    finally:
+      self.binary = False
+
+  def process_query(self, statement):
+    function, params = statement.function, statement.params
 
     if function is None:
       return False
@@ -252,8 +689,10 @@ class Server(StreamRequestHandler):
     elif function == "show_index":
       table = self._extract_table(params["table"])
       self.send_resultset(self.db.show_indexes(table))
-    elif function == "show_variables" or function == "show_status":
+    elif function == "show_variables":
       self.send_resultset(self.db.show_variables())
+    elif function == "show_status":
+      self.send_resultset(self.db.show_status(self.status(params["modifier"]), params["pattern"]))
     elif function == "show_engines":
       self.send_resultset(self.db.show_engines())
     elif function == "show_collation":
@@ -266,6 +705,11 @@ class Server(StreamRequestHandler):
       self.use_database(params["database"])
     elif function == "show_processlist":
       self.send_processlist(params["modifier"])
+    elif function == "kill":
+      modifier = params["modifier"]
+      self.kill(int(params["id"]), modifier is None or modifier.upper() == "CONNECTION")
+    elif function == "set_variable":
+      self.set_variable(params["modifier"], params["name"], int(params["value"]))
     elif function == "help":
       self.send_error("Help database is corrupt or does not exist", 1244, "HY000")
     else:
@@ -273,71 +717,235 @@ class Server(StreamRequestHandler):
 
     return True
 
-  def handle(self):
-    self.db = Database(self.server.filename)
-    self.thread = int(current_thread().name.split("-")[-1])
+  def admit(self):
+    return self.server.admission.enter()
+
+  def open(self):
+    self.pool = self.schema_pool()
+    self.thread = next(self.server.identifiers)
+    self.counters = self.server.counters.connect(self.thread)
+    if self.server.metrics is not None:
+      self.metrics = self.server.metrics.connect(self.thread)
     self.packet = BytesIO()
+    self.packet_limit = self.server.max_allowed_packet
+    self.statements = {}
+    self.max_execution_time = self.server.max_execution_time
+
+    if not self.admit():  # sent in place of the handshake
+      self.send_error("Too many connections", 1040, "08004")
+      return False
+
+    self.admitted = True
+
+    try:
+      self.db = self.pool.acquire()
+    except PoolTimeout as e:
+      self.send_error(str(e), 1040, "08004")
+      return False
+
     self.send_handshake()
+
+    if self.pool.per_query:
+      self.give_back()
+
     self.port = self.client_address[1]
     connections[self.port] = {"thread": self.thread, "username": None,
                               "host": f"{self.client_address[0]}:{self.client_address[1]}",
                               "schema": None, "time": monotonic(),
-                              "command": Command.CONNECT.value}
+                              "command": Command.CONNECT.value, "session": self}
 
-    while True:
-      length, self.number = read_header(self.rfile)
+    return True
 
-      payload = BytesIO()
-      payload.write(self.rfile.read(length))
-      payload.seek(0)
+  def dispatch(self, payload):
+    if not self.pool.per_query:
+      if self.pool.stale(self.db) and self.db.inst.getautocommit():  # a newer snapshot, move on to it
+        try:
+          db = self.pool.acquire()
+        except PoolTimeout as e:
+          self.send_error(str(e), 1040, "08004")
+          return True
 
-      debug(f"< {payload.getvalue()}")
+        self.give_back(self.pool, db)
 
-      if not self.connected:
-        self.handle_handshake(payload)
-        connections[self.port]["username"] = self.username
-        connections[self.port]["time"] = monotonic()
-        connections[self.port]["command"] = Command.SLEEP.value
-        continue
+      return self.handle_command(payload)
 
-      command = read_data(payload, "<B")[0]
-      connections[self.port]["command"] = command
-      connections[self.port]["time"] = monotonic()
+    try:
+      self.pool = self.schema_pool()  # idle schemas may have been closed meanwhile
+      self.db = self.pool.acquire()
+    except PoolTimeout as e:
+      self.send_error(str(e), 1040, "08004")
+      return True
 
-      if command == Command.QUERY:
-        query = read_string(payload).strip().strip(";")
-        info(f"QUERY: {query}")
-
-        keyword = query.split(" ", 1)[0].upper()
-
-        if keyword == "SELECT":
-          try:
-            self.send_resultset(self.db.execute(query))
-          except Exception as e:
-            print_exc()
-            self.send_error(str(e))
-        elif not self.process_query(query):
-          if keyword == "SET":
-            self.send_ok()
-          else:
-            message = f"Access denied for user '{self.username}'@'{self.client_address[0]}' to database '{self.schema}'"
-            self.send_error(message, 1044)
-      elif command == Command.INIT_DB:
-        name = read_string(payload)
-        self.use_database(name)
-      elif command == Command.QUIT:
-        break
-      elif command == Command.PING:
-        self.send_ok()
-      else:
-        if command in Command.__members__.values():
-          self.send_unsupported(Command(command).name)
-        else:
-          self.send_unsupported("UNKNOWN")
+    try:
+      return self.handle_command(payload)
+    finally:
+      self.give_back()
 
+  def handle_command(self, payload):
+    self.traced = trace.sampled()
+
+    if self.traced and trace.packets:
+      debug("< %r", payload.getvalue())
+
+    if not self.connected:
+      self.handle_handshake(payload)
+      connections[self.port]["username"] = self.username
       connections[self.port]["time"] = monotonic()
       connections[self.port]["command"] = Command.SLEEP.value
+      return True
+
+    command = read_data(payload, "<B")[0]
+    started = monotonic()
+    connections[self.port]["command"] = command
+    connections[self.port]["time"] = started
+
+    if command in PROTOCOL:
+      self.counters[PROTOCOL[command]] += 1
+    if self.metrics is not None:
+      self.metrics.commands[command] += 1
+
+    if command in QUESTIONS:
+      self.counters["Questions"] += 1
+      sent = self.counters["Bytes_sent"]
+
+      if self.metrics is not None:
+        self.metrics.statement = Command(command).name.lower()
+
+      if self.server.slow_log is not None:
+        self.timer = QueryTimer(started, self.counters)
+        self.db.statement_status = None
+
+    if command == Command.QUERY:
+      query = read_string(payload).strip().strip(";")
+      if self.traced and trace.queries:
+        info("QUERY: %s", query)
+      if self.timer is not None:
+        self.timer.query = query
+
+      self.run_query(query)
+    elif command == Command.STMT_PREPARE:
+      self.prepare_statement(read_string(payload).strip().strip(";"))
+    elif command == Command.STMT_EXECUTE:
+      self.execute_statement(payload)
+    elif command == Command.STMT_SEND_LONG_DATA:
+      identifier, index = read_data(payload, "<IH")
+      if identifier in self.statements:
+        self.statements[identifier].add_long_data(index, payload.read(), self.server.max_allowed_packet)
+    elif command == Command.STMT_RESET:
+      identifier = read_data(payload, "<I")[0]
+      if identifier in self.statements:
+        self.statements[identifier].reset()
+        self.send_ok()
+      else:
+        self.send_unknown_statement(identifier, "mysqld_stmt_reset")
+    elif command == Command.STMT_CLOSE:
+      self.statements.pop(read_data(payload, "<I")[0], None)
+    elif command == Command.INIT_DB:
+      name = read_string(payload)
+      self.use_database(name)
+    elif command == Command.QUIT:
+      self.quitting = True
+      return False
+    elif command == Command.PROCESS_KILL:
+      self.kill(read_data(payload, "<I")[0])
+    elif command == Command.PING:
+      self.send_ok()
+    else:
+      if command in Command.__members__.values():
+        self.send_unsupported(Command(command).name)
+      else:
+        self.send_unsupported("UNKNOWN")
+
+    finished = monotonic()
+    connections[self.port]["time"] = finished
+    connections[self.port]["command"] = Command.SLEEP.value
+
+    if command in QUESTIONS:
+      elapsed = finished - started
+
+      if self.metrics is not None:
+        self.metrics.observe(elapsed, self.counters["Bytes_sent"] - sent)
+
+      if elapsed > self.server.long_query_time:
+        self.counters["Slow_queries"] += 1
+
+        if self.timer is not None:
+          self.server.slow_log.write(self, self.timer, finished, self.db.statement_status)
+
+    self.timer = None
+
+    if self.db is not None:
+      self.db.limit(None)
+
+    return not self.killed
+
+  def close(self):
+    connections.pop(self.port, None)
+
+    if self.counters is not None:
+      self.server.counters.disconnect(self.thread, self.connected, not self.quitting)
+      self.counters = None
+
+    if self.metrics is not None:
+      self.server.metrics.disconnect(self.thread)
+      self.metrics = None
+
+    if self.admitted:
+      self.server.admission.leave()
+      self.admitted = False
+
+    if self.db is not None:
+      self.give_back()
+
+
+class Server(Session, StreamRequestHandler):
+  reader = None
+  inflated = None
+
+  def start_compression(self):
+    super().start_compression()
+    self.inflated = CompressedReader(self, self.reader)  # rfile stays, finish() closes it
+
+  def read_packet(self):
+    if not self.compressed:
+      payload, self.number, size = self.reader.packet(self.server.max_allowed_packet)
+      self.counters["Bytes_received"] += size
+      return payload
+
+    chunks = []
+    total = 0
+
+    while True:  # payloads of 16M or more come in several packets
+      length, self.number = read_header(self.inflated)
+      total += length
+
+      if total > self.server.max_allowed_packet:
+        raise PacketTooLarge()
+
+      chunks.append(self.inflated.read(length))
+
+      if length < MAX_PACKET:
+        self.counters["Bytes_received"] += total + 4 * len(chunks)
+        return Payload(b"".join(chunks))
+
+  def handle(self):
+    self.reader = PacketReader(self.request)
+
+    if not self.open():
+      return
+
+    while True:
+      try:
+        payload = self.read_packet()
+      except (PacketTooLarge, CompressionError) as e:
+        self.send_exception(e)
+        break
+      except ConnectionError:  # gone without COM_QUIT
+        break
+
+      if not self.dispatch(payload):
+        break
 
   def finish(self):
     super().finish()
-    del connections[self.port]
+    self.close()
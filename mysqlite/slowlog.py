@@ -0,0 +1,73 @@
+from datetime import datetime, timezone
+from logging import INFO, FileHandler, Formatter, StreamHandler, getLogger
+from time import monotonic, time
+
+
+class QueryTimer:  # phases of one statement, only created while the slow log is on
+  def __init__(self, started, counters):
+    self.started = self.last = started
+    self.query = ""
+    self.parse = 0.0
+    self.execute = 0.0  # sqlite prepare and step, including the lazy row fetches
+    self.write = 0.0
+    self.cache_hit = False
+    self.rows_sent = counters["Rows_sent"]
+    self.bytes_sent = counters["Bytes_sent"]
+
+  def lap(self):  # time since the command arrived (or the last lap) is parsing
+    now = monotonic()
+    self.parse += now - self.last
+    self.last = now
+
+  def rows(self, rows):
+    rows = iter(rows)
+
+    while True:
+      started = monotonic()
+
+      try:
+        row = next(rows)
+      except StopIteration:
+        return
+      finally:
+        self.execute += monotonic() - started
+
+      yield row
+
+
+class SlowLog:  # mysqld slow query log format, readable by pt-query-digest
+  def __init__(self, filename):
+    self.logger = getLogger("mysqlite.slow")
+    self.logger.propagate = False
+    self.logger.setLevel(INFO)
+
+    handler = StreamHandler() if filename == "-" else FileHandler(filename)
+    handler.setFormatter(Formatter("%(message)s"))
+    self.logger.addHandler(handler)
+
+  def write(self, session, timer, finished, status=None):
+    status = status or {}
+    elapsed = finished - timer.started
+    rows_sent = session.counters["Rows_sent"] - timer.rows_sent
+    bytes_sent = session.counters["Bytes_sent"] - timer.bytes_sent
+    scanned = status.get("SQLITE_STMTSTATUS_FULLSCAN_STEP", 0)  # index lookups do not count
+    encode = max(elapsed - timer.parse - timer.execute - timer.write, 0.0)
+    now = datetime.now(timezone.utc)
+    host = session.client_address[0]
+
+    lines = [f"# Time: {now.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}",
+             f"# User@Host: {session.username}[{session.username}] @ {host} [{host}]  Id: {session.thread}",
+             f"# Query_time: {elapsed:.6f}  Lock_time: 0.000000  Rows_sent: {rows_sent}  "
+             f"Rows_examined: {max(scanned, rows_sent)}  Bytes_sent: {bytes_sent}",
+             f"# Parse_time: {timer.parse:.6f}  Execute_time: {timer.execute:.6f}  "
+             f"Encode_time: {encode:.6f}  Write_time: {timer.write:.6f}",
+             f"# QC_Hit: {'Yes' if timer.cache_hit else 'No'}  Full_scan: {'Yes' if scanned else 'No'}  "
+             f"Filesort: {'Yes' if status.get('SQLITE_STMTSTATUS_SORT') else 'No'}"]
+
+    if session.schema:
+      lines.append(f"use {session.schema};")
+
+    lines.append(f"SET timestamp={int(time())};")
+    lines.append(f"{timer.query};")
+
+    self.logger.info("\n".join(lines))
@@ -0,0 +1,78 @@
+from ctypes import addressof, c_int64
+from logging import info, warning
+from os import getpid
+from os.path import getsize
+from threading import Thread
+from time import monotonic, sleep
+
+from apsw import SQLITE_FCNTL_SIZE_LIMIT, SQLITE_OPEN_CREATE, \
+  SQLITE_OPEN_READONLY, SQLITE_OPEN_READWRITE, SQLITE_OPEN_URI, Connection
+
+from mysqlite.utils import file_signature
+
+
+class Snapshot:  # the database copied into memory, copied again when the file is replaced
+  interval = 1.0  # seconds between checks of the file
+
+  def __init__(self, filename):
+    self.filename = filename
+    self.generation = 0
+    self.name = None  # memdb URI of the current copy, shared by every connection of this process
+    self.holder = None  # keeps the current copy alive until it is replaced
+    self.signature = None
+
+  def load(self):
+    started = monotonic()
+    signature = file_signature(self.filename)
+    name = f"file:/mysqlite-{getpid()}-{self.generation + 1}?vfs=memdb"
+
+    target = Connection(name, SQLITE_OPEN_READWRITE | SQLITE_OPEN_CREATE | SQLITE_OPEN_URI)
+    limit = c_int64(-1)  # memdb stops growing at 1G by default
+    target.file_control("main", SQLITE_FCNTL_SIZE_LIMIT, addressof(limit))
+    limit.value = max(limit.value, 2 * getsize(self.filename))
+    target.file_control("main", SQLITE_FCNTL_SIZE_LIMIT, addressof(limit))
+
+    source = Connection(self.filename, SQLITE_OPEN_READONLY)
+
+    try:
+      with target.backup("main", source, "main") as backup:
+        backup.step()  # every page in one go, a consistent copy even while the file is written
+        pages = backup.pagecount
+    except Exception:
+      target.close()
+      raise
+    finally:
+      source.close()
+
+    previous, self.holder = self.holder, target
+    self.name, self.signature = name, signature
+    self.generation += 1
+
+    if previous is not None:  # connections still reading it keep it until they close
+      previous.close()
+
+    info(f"SNAPSHOT {self.generation} LOADED ({pages} pages in {monotonic() - started:.2f}s)")
+    return name
+
+  def changed(self):  # replaced or written, and left alone for a whole interval
+    signature = file_signature(self.filename)
+
+    if signature == self.signature:
+      return False
+
+    sleep(self.interval)
+    return signature == file_signature(self.filename)
+
+  def _watch(self, pool):
+    while True:
+      sleep(self.interval)
+
+      try:
+        if self.changed():
+          pool.switch(self.load())
+      except Exception as e:  # a half-written file, try again on the next change
+        warning(f"SNAPSHOT NOT LOADED: {e}")
+        self.signature = file_signature(self.filename)
+
+  def start(self, pool):
+    Thread(target=self._watch, args=(pool, ), name="Snapshot", daemon=True).start()
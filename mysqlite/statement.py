@@ -0,0 +1,77 @@
+from mysqlite.definitions import FieldType
+from mysqlite.utils import BINARY_TYPES, PacketTooLarge, read_binary_value, \
+  read_data
+
+
+class Statement:
+  def __init__(self, identifier, query, params, meta, select):
+    self.id = identifier
+    self.query = query
+    self.params = params
+    self.meta = meta
+    self.select = select  # runs on sqlite, otherwise through process_query
+    self.types = [(FieldType.VAR_STRING, False)] * params
+    self.long_data = {}
+    self.long_sizes = {}
+    self.oversized = False  # a parameter went over the limit, the next execute fails
+
+  def add_long_data(self, index, data, limit):
+    if index >= self.params or self.oversized:
+      return
+
+    self.long_sizes[index] = self.long_sizes.get(index, 0) + len(data)
+
+    if self.long_sizes[index] > limit:  # the chunks are dropped, only the error is left
+      self.oversized = True
+      self.long_data = {}
+    else:
+      self.long_data.setdefault(index, []).append(data)
+
+  def reset(self):
+    self.long_data = {}
+    self.long_sizes = {}
+    self.oversized = False
+
+  def _join(self, index, _type):
+    value = b"".join(self.long_data[index])
+
+    if _type not in BINARY_TYPES:
+      try:
+        return value.decode("utf-8")
+      except UnicodeDecodeError:
+        pass
+
+    return value
+
+  def read_params(self, payload):
+    if self.oversized:
+      self.reset()
+      raise PacketTooLarge("Parameter of prepared statement which is set through "
+                           "mysql_send_long_data() is longer than 'max_allowed_packet' bytes")
+
+    read_data(payload, "<BI")  # flags, iteration count
+
+    if self.params == 0:
+      return ()
+
+    bitmap = payload.read((self.params + 7) // 8)
+
+    if read_data(payload, "<B")[0]:  # new params bound, types follow
+      self.types = []
+      for _ in range(self.params):
+        _type, flags = read_data(payload, "<BB")
+        self.types.append((_type, bool(flags & 0x80)))
+
+    values = []
+
+    for index, (_type, unsigned) in enumerate(self.types):
+      if bitmap[index >> 3] & (1 << (index & 7)):
+        values.append(None)
+      elif index in self.long_data:
+        values.append(self._join(index, _type))
+      else:
+        values.append(read_binary_value(payload, _type, unsigned))
+
+    self.reset()
+
+    return values
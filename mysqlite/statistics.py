@@ -0,0 +1,216 @@
+from logging import warning
+from queue import Queue
+from threading import Lock, Thread
+
+from mysqlite.utils import file_signature
+
+
+class Statistics:  # table estimates shared by every connection to the same file
+  instances = {}
+  lock = Lock()
+
+  def __init__(self, filename, settings):
+    self.filename = filename
+    self.settings = settings  # the worker opens the file as the pool does
+    self.version = None
+    self.tables = {}
+    self.sizes = None  # dbstat pages per table and index, None = not computed
+    self.pending = set()
+    self.queue = Queue()
+    self.lock = Lock()
+    self.worker = None
+    self.connection = None  # of the worker
+    self.stopped = False
+
+  @classmethod
+  def get(cls, filename, settings):
+    with cls.lock:
+      if filename not in cls.instances:
+        cls.instances[filename] = cls(filename, settings)
+      return cls.instances[filename]
+
+  @classmethod
+  def release(cls, filename):  # when no pool serves the file anymore
+    with cls.lock:
+      statistics = cls.instances.pop(filename, None)
+
+    if statistics is not None:
+      statistics.stop()
+
+  def stop(self):  # the worker closes its connection and exits, estimates stay readable
+    with self.lock:
+      self.stopped = True
+      self.queue.put(None)
+
+      if self.connection is not None:
+        self.connection.interrupt()
+
+  def _validate(self):  # called with the lock held
+    version = file_signature(self.filename)
+
+    if version != self.version:
+      self.version = version
+      self.tables = {}
+      self.sizes = None
+      self.pending = set()
+
+  def _schedule(self, table, columns):  # called with the lock held
+    if table in self.pending or self.stopped:
+      return
+
+    self.pending.add(table)
+    self.queue.put((self.version, table, columns))
+
+    if self.worker is None:
+      self.worker = Thread(target=self._work, name="Statistics", daemon=True)
+      self.worker.start()
+
+  def table(self, db, table, serial, indexes):  # serial = the integer primary key column or None
+    with self.lock:
+      self._validate()
+
+      if table in self.tables:
+        return self.tables[table]
+
+      version = self.version
+
+    stats = self._estimate(db, table, serial)
+
+    with self.lock:
+      if version != self.version:
+        return stats
+
+      self.tables[table] = stats
+
+      if self.sizes is not None:
+        stats["data_length"], stats["index_length"] = self.sizes.get(table, (0, 0))
+
+      if stats["rows"] is None or self.sizes is None or \
+         any(index not in stats["cardinality"] for index, _ in indexes):
+        self._schedule(table, indexes)
+
+      return stats
+
+  def _stat1(self, db):
+    query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+    return db._execute(query).fetchone() is not None
+
+  def _estimate(self, db, table, serial):
+    stats = {"rows": None, "auto_increment": None, "data_length": None,
+             "index_length": None, "cardinality": {}}
+
+    if self._stat1(db):
+      query = "SELECT idx, stat FROM sqlite_stat1 WHERE tbl = ?"
+
+      for index, stat in db._execute(query, (table, )):
+        numbers = [int(number) for number in stat.split()[:2] if number.isdigit()]
+
+        if numbers:
+          stats["rows"] = max(stats["rows"] or 0, numbers[0])
+
+        if index is not None and len(numbers) == 2:
+          stats["cardinality"][index] = numbers[0] // max(numbers[1], 1)
+
+    if serial is not None:
+      try:
+        stats["auto_increment"] = self._next_id(db, table, serial)
+      except Exception as e:  # left unknown, the other tables are still listed
+        warning(f"STATISTICS {table}: {e}")
+
+    return stats
+
+  def _next_id(self, db, table, column):
+    query = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_sequence'"
+
+    if db._execute(query).fetchone() is not None:
+      row = db._execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table, )).fetchone()
+
+      if row is not None:
+        return row[0] + 1
+
+    return (db._execute(f"SELECT MAX([{column}]) FROM [{table}]").fetchone()[0] or 0) + 1  # WITHOUT ROWID too
+
+  def _work(self):
+    connection = self.settings.connect(self.filename)
+
+    with self.lock:
+      self.connection = connection
+
+    try:
+      while True:
+        item = self.queue.get()
+
+        if item is None or self.stopped:
+          break
+
+        version, table, indexes = item
+
+        try:
+          self._compute(connection, version, table, indexes)
+        except Exception as e:
+          if not self.stopped:
+            warning(f"STATISTICS {table}: {e}")
+
+        with self.lock:
+          self.pending.discard(table)
+    finally:
+      with self.lock:
+        self.connection = None
+
+      connection.close()
+
+  def _compute(self, connection, version, table, indexes):
+    with self.lock:
+      stats = self.tables.get(table)
+      sizes = self.sizes
+
+      if version != self.version or stats is None:
+        return
+
+    rows = stats["rows"]
+    if rows is None:
+      rows = connection.execute(f"SELECT COUNT(1) FROM [{table}]").fetchone()[0]
+
+    cardinality = dict(stats["cardinality"])
+    for index, column in indexes:
+      if cardinality.get(index) is None:
+        query = f"SELECT COUNT(DISTINCT([{column}])) FROM [{table}]"
+        cardinality[index] = connection.execute(query).fetchone()[0]
+
+    if sizes is None:
+      sizes = self._sizes(connection)
+
+    with self.lock:
+      if version != self.version:
+        return
+
+      self.sizes = sizes
+      stats.update(rows=rows, cardinality=cardinality)
+
+      for name, info in self.tables.items():  # sizes cover every table at once
+        info["data_length"], info["index_length"] = sizes.get(name, (0, 0))
+
+  def _sizes(self, connection):
+    sizes = {}
+    owners = {}
+
+    for name, table in connection.execute("SELECT name, tbl_name FROM sqlite_master"):
+      owners[name] = table
+
+    try:
+      pages = connection.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall()
+    except Exception:  # sqlite built without SQLITE_ENABLE_DBSTAT_VTAB
+      return sizes
+
+    for name, size in pages:
+      table = owners.get(name, name)
+      data, index = sizes.get(table, (0, 0))
+
+      if name == table:
+        data += size
+      else:  # indexes, including automatic ones for unique/primary keys
+        index += size
+
+      sizes[table] = (data, index)
+
+    return sizes
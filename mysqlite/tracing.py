@@ -0,0 +1,43 @@
+import signal
+from itertools import count
+from logging import DEBUG, INFO, getLogger, info
+
+
+class Trace:
+  packets = False
+  queries = True
+  sample = 1
+
+  def __init__(self):
+    self.counter = count()
+
+  def configure(self, packets=False, queries=True, sample=1):
+    self.set_packets(packets)
+    self.queries = queries
+    self.sample = max(sample, 1)
+
+  def set_packets(self, enabled):
+    self.packets = enabled
+    getLogger().setLevel(DEBUG if enabled else INFO)
+
+  def sampled(self):
+    # called once per command, callers check the flags before formatting anything
+    if not self.packets and not self.queries:
+      return False
+    return self.sample == 1 or next(self.counter) % self.sample == 0
+
+  def toggle_packets(self, signum=None, frame=None):
+    self.set_packets(not self.packets)
+    info("PACKETS: %s", "ON" if self.packets else "OFF")
+
+  def toggle_queries(self, signum=None, frame=None):
+    self.queries = not self.queries
+    info("QUERIES: %s", "ON" if self.queries else "OFF")
+
+  def install_signals(self):
+    if hasattr(signal, "SIGUSR1"):  # not available on windows
+      signal.signal(signal.SIGUSR1, self.toggle_packets)
+      signal.signal(signal.SIGUSR2, self.toggle_queries)
+
+
+trace = Trace()
@@ -1,5 +1,75 @@
-from io import BytesIO
-from struct import calcsize, pack, unpack
+from datetime import datetime
+from os import stat
+from re import compile
+from struct import calcsize, pack, unpack, unpack_from
+
+from mysqlite.definitions import FieldType
+
+
+MAX_PACKET = 0xffffff  # larger payloads are split into several packets
+VARLENGTHS = [bytes((length, )) for length in range(251)]  # 1-byte prefixes
+NULL_CELL = b"\xfb"
+BINARY_TYPES = [FieldType.TINY_BLOB, FieldType.MEDIUM_BLOB, FieldType.LONG_BLOB,
+                FieldType.BLOB, FieldType.GEOMETRY]
+DATETIME = compile(r"\d{4}-\d\d-\d\d(?: \d\d:\d\d:\d\d)?")  # the text a client reads as the same value
+
+
+class PacketTooLarge(Exception):
+  def __init__(self, message="Got a packet bigger than 'max_allowed_packet' bytes"):
+    super().__init__(message)
+
+
+class WrongValue(ValueError):  # a cell without the exact binary form of its column
+  def __init__(self, kind, value):
+    super().__init__(f"Incorrect {kind} value: '{value}'")
+
+
+class Payload:  # read cursor over one packet, slices the buffer instead of copying it
+  def __init__(self, data, view=None, start=0, end=None):
+    self.data = data  # bytes or bytearray, possibly reused once the packet is handled
+    self.view = memoryview(data) if view is None else view
+    self.start = self.position = start
+    self.end = len(data) if end is None else end
+
+  def __len__(self):
+    return self.end - self.start
+
+  def read(self, size=-1):  # copies, the result may outlive the buffer
+    start = self.position
+    self.position = self.end if size < 0 else min(start + size, self.end)
+    return bytes(self.view[start:self.position])
+
+  def unpack(self, fmt):
+    values = unpack_from(fmt, self.view, self.position)
+    self.position += calcsize(fmt)
+    return values
+
+  def read_string(self):  # null-terminated, decoded straight from the buffer
+    start = self.position
+    end = self.data.find(b"\0", start, self.end)
+
+    if end < 0:
+      end = self.position = self.end
+    else:
+      self.position = end + 1
+
+    return str(self.view[start:end], "utf-8")
+
+  def getvalue(self):
+    return bytes(self.view[self.start:self.end])
+
+
+def file_signature(filename):  # changes whenever the database or its wal is written
+  signature = []
+
+  for name in (filename, f"{filename}-wal"):
+    try:
+      info = stat(name)
+      signature.append((info.st_mtime_ns, info.st_size, info.st_ino))
+    except FileNotFoundError:
+      signature.append(None)
+
+  return tuple(signature)
 
 
 def pack_string(value=None):
@@ -64,27 +134,239 @@ def pack_varinteger(value):
     return pack_byte(0xfe) + pack_doublelong(value)
 
 
+def convert_text(value):
+  if type(value) is str:
+    return value.encode()
+  elif type(value) is bytes:
+    return value
+  else:
+    return str(value).encode()
+
+
+def convert_integer(value):
+  if type(value) is int:
+    return b"%d" % value
+  return convert_text(value)
+
+
+def convert_double(value):
+  if type(value) is float:
+    return repr(value).encode()
+  return convert_text(value)
+
+
+def convert_blob(value):
+  if type(value) is bytes:
+    return value
+  return convert_text(value)
+
+
+CONVERTERS = {
+  FieldType.LONGLONG: convert_integer,
+  FieldType.DOUBLE: convert_double,
+  FieldType.BLOB: convert_blob,
+}
+
+
+def column_converters(meta):
+  return [CONVERTERS.get(_type, convert_text) for (_, _, _type, _, _) in meta]
+
+
+def pack_row(row, converters):
+  parts = []
+  append = parts.append
+
+  for value, convert in zip(row, converters):
+    if value is None:
+      append(NULL_CELL)
+      continue
+
+    value = convert(value)
+    length = len(value)
+    append(VARLENGTHS[length] if length < 251 else pack_varinteger(length))
+    append(value)
+
+  return b"".join(parts)
+
+
+def pack_rows(rows, converters):
+  for row in rows:
+    yield pack_row(row, converters)
+
+
+def binary_text(value):
+  value = convert_text(value)
+  length = len(value)
+  return (VARLENGTHS[length] if length < 251 else pack_varinteger(length)) + value
+
+
+def binary_integer(value):
+  if type(value) is not int:  # sqlite columns can hold any type
+    raise WrongValue("integer", value)
+  return pack("<q", value)
+
+
+def binary_double(value):
+  if type(value) not in [int, float]:
+    raise WrongValue("double", value)
+  return pack("<d", value)
+
+
+def binary_datetime(value):  # numbers, offsets and fractions would read differently than as text
+  if type(value) is not str or not DATETIME.fullmatch(value):
+    raise WrongValue("datetime", value)
+
+  try:
+    value = datetime.fromisoformat(value)
+  except ValueError:
+    raise WrongValue("datetime", value) from None
+
+  if value.hour or value.minute or value.second:
+    return pack("<BHBBBBB", 7, value.year, value.month, value.day, value.hour,
+                value.minute, value.second)
+  else:
+    return pack("<BHBB", 4, value.year, value.month, value.day)
+
+
+BINARY_CONVERTERS = {
+  FieldType.LONGLONG: binary_integer,
+  FieldType.DOUBLE: binary_double,
+  FieldType.DATETIME: binary_datetime,
+  FieldType.TIMESTAMP: binary_datetime,
+}
+
+
+def binary_meta(meta, row):  # columns whose first value has no exact binary form are sent as text
+  if row is None:
+    return meta
+
+  new_meta = []
+
+  for (name, field, _type, length, decimals), value in zip(meta, row):
+    convert = BINARY_CONVERTERS.get(_type)
+
+    if convert is not None and value is not None:
+      try:
+        convert(value)
+      except WrongValue:
+        _type = FieldType.VAR_STRING
+
+    new_meta.append((name, field, _type, length, decimals))
+
+  return new_meta
+
+
+def binary_converters(meta):
+  return [BINARY_CONVERTERS.get(_type, binary_text) for (_, _, _type, _, _) in meta]
+
+
+def pack_binary_row(row, converters):
+  bitmap = bytearray((len(converters) + 9) // 8)  # null bitmap has an offset of 2
+  parts = [b"\0", None]
+  append = parts.append
+
+  for index, (value, convert) in enumerate(zip(row, converters)):
+    if value is None:
+      bitmap[(index + 2) >> 3] |= 1 << ((index + 2) & 7)
+    else:
+      append(convert(value))
+
+  parts[1] = bytes(bitmap)
+  return b"".join(parts)
+
+
+def pack_binary_rows(rows, converters):
+  for row in rows:
+    yield pack_binary_row(row, converters)
+
+
 def pack_header(length, number):
   return pack_long(length)[:-1] + pack_byte(number)
 
 
 def read_data(payload, fmt):
+  if type(payload) is Payload:
+    return payload.unpack(fmt)
+
   data = payload.read(calcsize(fmt))
   return unpack(fmt, data)
 
 
 def read_string(payload):
-  buffer = BytesIO()
+  if type(payload) is Payload:
+    return payload.read_string()
 
-  while True:
-    character = payload.read(1)
+  data = payload.getvalue()  # BytesIO shares its buffer, no copy
+  start = payload.tell()
+  end = data.find(b"\0", start)
 
-    if len(character) == 0 or ord(character) == 0:
-      break
+  if end < 0:
+    end = len(data)
+    payload.seek(end)
+  else:
+    payload.seek(end + 1)
+
+  return data[start:end].decode("utf-8")
 
-    buffer.write(character)
 
-  return buffer.getvalue().decode("utf-8")
+def read_varinteger(payload):
+  value = read_data(payload, "<B")[0]
+
+  if value == 0xfc:
+    return read_data(payload, "<H")[0]
+  elif value == 0xfd:
+    return unpack("<I", payload.read(3) + b"\0")[0]
+  elif value == 0xfe:
+    return read_data(payload, "<Q")[0]
+  else:
+    return value
+
+
+def read_binary_value(payload, _type, unsigned=False):
+  if _type == FieldType.NULL:
+    return None
+  elif _type == FieldType.TINY:
+    return read_data(payload, "<B" if unsigned else "<b")[0]
+  elif _type in [FieldType.SHORT, FieldType.YEAR]:
+    return read_data(payload, "<H" if unsigned else "<h")[0]
+  elif _type in [FieldType.LONG, FieldType.INT24]:
+    return read_data(payload, "<I" if unsigned else "<i")[0]
+  elif _type == FieldType.LONGLONG:
+    return read_data(payload, "<Q" if unsigned else "<q")[0]
+  elif _type == FieldType.FLOAT:
+    return read_data(payload, "<f")[0]
+  elif _type == FieldType.DOUBLE:
+    return read_data(payload, "<d")[0]
+  elif _type in [FieldType.DATE, FieldType.DATETIME, FieldType.TIMESTAMP]:
+    length = read_data(payload, "<B")[0]
+    year, month, day, hour, minute, second, micro = [0] * 7
+    if length >= 4:
+      year, month, day = read_data(payload, "<HBB")
+    if length >= 7:
+      hour, minute, second = read_data(payload, "<BBB")
+    if length >= 11:
+      micro = read_data(payload, "<I")[0]
+    if _type == FieldType.DATE:
+      return "%04d-%02d-%02d" % (year, month, day)
+    text = "%04d-%02d-%02d %02d:%02d:%02d" % (year, month, day, hour, minute, second)
+    return f"{text}.{micro:06d}" if micro else text
+  elif _type == FieldType.TIME:
+    length = read_data(payload, "<B")[0]
+    negative, days, hour, minute, second, micro = [0] * 6
+    if length >= 8:
+      negative, days, hour, minute, second = read_data(payload, "<BIBBB")
+    if length >= 12:
+      micro = read_data(payload, "<I")[0]
+    text = "%s%02d:%02d:%02d" % ("-" if negative else "", days * 24 + hour, minute, second)
+    return f"{text}.{micro:06d}" if micro else text
+  else:  # decimals, strings, blobs, json...
+    value = payload.read(read_varinteger(payload))
+    if _type in BINARY_TYPES:
+      return value
+    try:
+      return value.decode("utf-8")
+    except UnicodeDecodeError:
+      return value
 
 
 def read_varstring(payload):
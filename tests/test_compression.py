@@ -0,0 +1,44 @@
+from unittest import TestCase, main
+from zlib import compress
+
+from mysqlite.compression import Compression, CompressionError
+from mysqlite.utils import MAX_PACKET
+
+
+class CompressionTest(TestCase):
+  def setUp(self):
+    self.compression = Compression()
+
+  def test_round_trip(self):
+    data = b"SELECT 1" * 100
+    frames, _ = self.compression.pack(data, 0)
+    self.assertEqual(self.compression.unpack(frames[7:], len(data)), data)
+
+  def test_uncompressed_frame(self):
+    self.assertEqual(self.compression.unpack(b"SELECT 1", 0), b"SELECT 1")
+
+  def test_frame_inflating_past_its_size(self):
+    payload = compress(b"\0" * 300000)  # a few hundred bytes, announced as 100
+
+    with self.assertRaises(CompressionError):
+      self.compression.unpack(payload, 100)
+
+  def test_frame_inflating_short_of_its_size(self):
+    with self.assertRaises(CompressionError):
+      self.compression.unpack(compress(b"\0" * 100), 300000)
+
+  def test_frame_larger_than_a_packet(self):
+    with self.assertRaises(CompressionError):
+      self.compression.unpack(compress(b"\0" * 100), MAX_PACKET + 5)
+
+  def test_trailing_data(self):
+    with self.assertRaises(CompressionError):
+      self.compression.unpack(compress(b"\0" * 100) + b"\0", 100)
+
+  def test_corrupt_frame(self):
+    with self.assertRaises(CompressionError):
+      self.compression.unpack(b"not zlib", 100)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,57 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+from unittest import TestCase, main
+
+from apsw import SQLITE_OPEN_READONLY, SQLITE_OPEN_URI, Connection
+
+from mysqlite.database import Catalog, Pool
+from mysqlite.snapshot import Snapshot
+from mysqlite.statistics import Statistics
+
+
+class SnapshotTest(TestCase):
+  def setUp(self):
+    self.directory = TemporaryDirectory()
+    self.filename = join(self.directory.name, "test.db")
+
+    connection = Connection(self.filename)
+    connection.execute("CREATE TABLE users (id INTEGER PRIMARY KEY NOT NULL, name TEXT)")
+    connection.execute("INSERT INTO users (name) VALUES ('first')")
+    connection.close()
+
+  def tearDown(self):
+    self.directory.cleanup()
+
+  def tables(self, name):  # a freed memdb copy opens again, but empty
+    connection = Connection(name, SQLITE_OPEN_READONLY | SQLITE_OPEN_URI)
+
+    try:
+      return connection.execute("SELECT COUNT(1) FROM sqlite_master").fetchone()[0]
+    finally:
+      connection.close()
+
+  def test_switch_frees_previous_copy(self):
+    snapshot = Snapshot(self.filename)
+    pool = Pool(snapshot.load())
+    old = pool.filename
+
+    db = pool.acquire()
+    db.show_table_status()  # starts the statistics worker, with its own connection to the copy
+    statistics = db.statistics
+    pool.release(db)
+    self.assertEqual(self.tables(old), 1)
+
+    pool.switch(snapshot.load())
+    statistics.worker.join(5)
+
+    self.assertFalse(statistics.worker.is_alive())
+    self.assertNotIn(old, Statistics.instances)
+    self.assertNotIn(old, Catalog.catalogs)
+    self.assertEqual(self.tables(old), 0)
+    self.assertEqual(self.tables(pool.filename), 1)
+
+    pool.close()
+
+
+if __name__ == "__main__":
+  main()